@@ -0,0 +1,147 @@
+import logging
+import os
+import shutil
+from typing import Iterable
+from functools import cache
+from pathlib import Path
+
+import constants as c
+import timing as tm
+
+log = logging.getLogger(__name__)
+
+FICLONE = 0x40049409  # linux ioctl for a copy-on-write clone (btrfs, xfs, ...)
+
+
+def _reflink(src: Path, dst: Path):
+    import fcntl
+
+    with open(src, "rb") as s, open(dst, "wb") as d:
+        fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+
+
+def _clone_or_copy(src: Path, dst: Path):
+    # a reflink shares the data but can't be changed through the source. Not a hardlink: the asset is shared by every
+    # recipe embedding the same image, and editing the linked source in place would change it under its old hash.
+    try:
+        _reflink(src, dst)
+        return
+    except (ImportError, OSError):
+        dst.unlink(missing_ok=True)
+    shutil.copyfile(src, dst)
+
+
+@cache
+def _pillow() -> tuple:
+    # imported when the first thumbnail is needed, rather than on every build
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:  # thumbnails are skipped and the grid shows the full size images
+        return None, None
+    logging.getLogger("PIL").setLevel(logging.INFO)
+    return Image, ImageOps
+
+
+def _tmp_path(dst: Path) -> Path:
+    # a per-process temp file, so parallel workers never expose a partial image
+    return dst.with_name(f".{dst.name}.{os.getpid()}.tmp")
+
+
+def publish(src: Path, sha256: str, assets_path: Path) -> Path:
+    """Add an image to the assets folder under a name derived from its content, so identical images shared by
+    several recipes are stored once and an existing asset never needs to be copied again
+
+    Args:
+        src (Path): source image
+        sha256 (str): hash of the source image's content
+        assets_path (Path): the image assets folder
+
+    Returns:
+        Path: path of the asset
+    """
+    asset_path = assets_path.joinpath(f"{sha256[:16]}{src.suffix.lower()}")
+    if not asset_path.exists():
+        tmp = _tmp_path(asset_path)
+        _clone_or_copy(src, tmp)
+        os.replace(tmp, asset_path)
+        tm.count("images_published")
+        log.debug(f"Added image to assets folder: {src.name} -> {asset_path.name}")
+    return asset_path
+
+
+def _save_image(src: Path, dst: Path, fmt: str) -> Path:
+    # src downscaled to the thumbnail size, in the format given
+    if dst.exists():
+        return dst
+    Image, ImageOps = _pillow()
+    if Image is None:
+        return None
+    tmp = _tmp_path(dst)
+    try:
+        with Image.open(src) as img:
+            img = ImageOps.exif_transpose(img)
+            img.thumbnail(c.THUMBNAIL_SIZE)
+            if fmt == "JPEG" and img.mode != "RGB":
+                img = img.convert("RGB")
+            img.save(tmp, format=fmt, quality=80)
+        os.replace(tmp, dst)
+        tm.count("bytes_written", dst.stat().st_size)
+    except Exception as ex:
+        tmp.unlink(missing_ok=True)
+        log.error(f"Error creating {dst.name} from {src.name}.\n\n{ex}")
+        return None
+    log.debug(f"Created thumbnail: {dst.name}")
+    return dst
+
+
+def thumbnail(asset_path: Path) -> Path:
+    """Downscale an asset for the recipe grid. Thumbnails are named after their asset, so they are only created
+    once per image content.
+
+    Args:
+        asset_path (Path): a published image asset
+
+    Returns:
+        Path: path of the thumbnail, or None if it could not be created (e.g. Pillow is not installed)
+    """
+    fmt = c.THUMBNAIL_FORMAT.upper()
+    return _save_image(asset_path, asset_path.with_name(f"{asset_path.stem}_thumb.{_suffix(fmt)}"), fmt)
+
+
+def _suffix(fmt: str) -> str:
+    return "jpg" if fmt == "JPEG" else fmt.lower()
+
+
+def webp_thumbnail(thumb_path: Path) -> Path:
+    """A WebP copy of a thumbnail, when THUMBNAIL_WEBP is set, for the browsers that support WebP to load instead
+
+    Returns:
+        Path: path of the WebP copy, or None if it is not wanted, the thumbnail already is a WebP or the copy could
+        not be created
+    """
+    if not c.THUMBNAIL_WEBP or thumb_path.suffix == ".webp":
+        return None
+    return _save_image(thumb_path, thumb_path.with_suffix(".webp"), "WEBP")
+
+
+def prune(assets_path: Path, hashes: Iterable[str]) -> int:
+    """Delete the assets, thumbnails included, of images no recipe embeds anymore
+
+    Args:
+        assets_path (Path): the image assets folder
+        hashes (Iterable[str]): sha256 of every image the recipes embed
+
+    Returns:
+        int: number of files deleted
+    """
+    keep, removed = {h[:16] for h in hashes}, 0
+    with os.scandir(assets_path) as entries:
+        for e in entries:
+            # the name starts with the image's hash, dot files are temp files of a build in progress
+            if not e.name.startswith(".") and e.name[:16] not in keep and e.is_file():
+                os.unlink(e.path)
+                removed += 1
+    if removed:
+        tm.count("assets_pruned", removed)
+        log.debug(f"Removed {removed} unused image assets")
+    return removed
@@ -1,41 +1,182 @@
-function filterByName() {
-    const searchQuery = document.getElementById('search-by-name').value.toLowerCase();
-    const recipeCards = document.querySelectorAll('.recipe-card');
-
-    recipeCards.forEach(card => {
-        const name = card.getAttribute('recipe-name');
-        if (name.includes(searchQuery)) {
-            card.style.display = 'block';
-        } else {
-            card.style.display = 'none';
+// RECIPE_INDEX is defined by recipe_index.js, see search_index.build_grid_index for its layout
+const CARD_MIN_WIDTH = 200;  // keep in sync with .grid in grid_style.css
+const GRID_GAP = 20;
+const OVERSCAN_ROWS = 2;
+
+const nameTokens = Object.entries(RECIPE_INDEX.tokens);
+let matches = RECIPE_INDEX.recipes.map((_, i) => i);
+let rowHeight = 300;  // corrected from the first rendered card
+let renderQueued = false;
+let filterVersion = 0;
+
+// full text index, loaded shard by shard as queries need them (see search_index.write_search_index)
+const search = { manifest: null, rows: null, shards: {}, loading: {} };
+
+function tokenize(s) {
+    return s.toLowerCase().split(/[^a-z0-9]+/).filter(Boolean);
+}
+
+function escapeHtml(s) {
+    return s.replace(/&/g, '&amp;').replace(/</g, '&lt;').replace(/"/g, '&quot;');
+}
+
+function fillOptions(id, values) {
+    const select = document.getElementById(id);
+    values.forEach((v, i) => {
+        if (v) {
+            select.add(new Option(v, i));
         }
     });
-};
-
-function filterByCuisine() {
-    const filterValue = document.getElementById('cuisine-filter').value.toLowerCase();
-    const recipeCards = document.querySelectorAll('.recipe-card');
-
-    recipeCards.forEach(card => {
-        const category = card.getAttribute('recipe-cuisine');
-        if (filterValue === 'all' || category === filterValue) {
-            card.style.display = 'block';
-        } else {
-            card.style.display = 'none';
+}
+
+function recipeCard(i) {
+    const [title, cuisine, category, url, image, webp] = RECIPE_INDEX.recipes[i];
+    const borderColor = RECIPE_INDEX.colors[RECIPE_INDEX.cuisines[cuisine]] || '#e9f9fb';
+    return `
+        <div class="recipe-card" style="border-color: ${borderColor};">
+            <a href="${escapeHtml(url)}">
+                <picture>
+                    ${webp ? `<source srcset="${escapeHtml(webp)}" type="image/webp">` : ''}
+                    <img src="${escapeHtml(image)}" alt="${escapeHtml(title)}" loading="lazy">
+                </picture>
+                <div class="caption">${escapeHtml(title)}</div>
+            </a>
+        </div>`;
+}
+
+function matchingName(words) {
+    // every word has to appear in one of the recipe's name tokens
+    let result = null;
+    for (const word of words) {
+        const hits = new Set();
+        for (const [token, ids] of nameTokens) {
+            if (token.includes(word)) {
+                ids.forEach(i => hits.add(i));
+            }
+        }
+        result = result ? new Set([...result].filter(i => hits.has(i))) : hits;
+    }
+    return result;
+}
+
+function loadScript(src) {
+    // script tags, unlike fetch, also work when the page is opened from the file system
+    return new Promise((resolve, reject) => {
+        const script = document.createElement('script');
+        script.src = src;
+        script.onload = resolve;
+        script.onerror = reject;
+        document.head.appendChild(script);
+    });
+}
+
+function registerSearchManifest(manifest) {
+    search.manifest = manifest;
+    search.rows = new Map(RECIPE_INDEX.recipes.map((r, i) => [r[3], i]));
+}
+
+function registerSearchShard(key, terms) {
+    search.shards[key] = Object.entries(terms);
+}
+
+function loadShard(key) {
+    if (!(key in search.loading)) {
+        search.loading[key] = loadScript(`${search.manifest.path}/${key}.js?v=${search.manifest.shards[key]}`);
+    }
+    return search.loading[key];
+}
+
+async function rankByText(words) {
+    // BM25 over the terms starting with each word; a recipe has to match every word
+    if (!search.manifest) {
+        await loadScript(RECIPE_INDEX.search);
+    }
+    const { docs, lengths, shards } = search.manifest;
+    await Promise.all([...new Set(words.map(w => w[0]))].filter(k => k in shards).map(loadShard));
+    const avgLength = lengths.reduce((a, b) => a + b, 0) / docs.length || 1;
+
+    let result = null;
+    for (const word of words) {
+        const wordScores = new Map();
+        for (const [term, postings] of search.shards[word[0]] || []) {
+            if (term.startsWith(word)) {
+                const df = postings.length / 2;
+                const idf = Math.log(1 + (docs.length - df + 0.5) / (df + 0.5));
+                for (let j = 0; j < postings.length; j += 2) {
+                    const [doc, tf] = [postings[j], postings[j + 1]];
+                    const score = idf * tf * 2.2 / (tf + 1.2 * (0.25 + 0.75 * lengths[doc] / avgLength));
+                    wordScores.set(doc, (wordScores.get(doc) || 0) + score);
+                }
+            }
+        }
+        result = result === null ? wordScores : new Map(
+            [...result].filter(([doc]) => wordScores.has(doc)).map(([doc, s]) => [doc, s + wordScores.get(doc)])
+        );
+    }
+
+    const scores = new Map();
+    result.forEach((score, doc) => {
+        const row = search.rows.get(docs[doc]);
+        if (row !== undefined) {
+            scores.set(row, score);
         }
     });
+    return scores;
 }
 
-function filterByCategory() {
-    const filterValue = document.getElementById('category-filter').value.toLowerCase();
-    const recipeCards = document.querySelectorAll('.recipe-card');
+async function filterRecipes() {
+    const version = ++filterVersion;
+    const names = matchingName(tokenize(document.getElementById('search-by-name').value));
+    const cuisine = Number(document.getElementById('cuisine-filter').value);
+    const category = Number(document.getElementById('category-filter').value);
+    const text = tokenize(document.getElementById('search-text').value);
+    const scores = text.length && RECIPE_INDEX.search ? await rankByText(text) : null;
+    if (version !== filterVersion) {
+        return;  // a newer keystroke has already filtered
+    }
 
-    recipeCards.forEach(card => {
-        const category = card.getAttribute('recipe-category');
-        if (filterValue === 'all' || category === filterValue) {
-            card.style.display = 'block';
-        } else {
-            card.style.display = 'none';
+    matches = [];
+    RECIPE_INDEX.recipes.forEach((r, i) => {
+        if ((cuisine < 0 || r[1] === cuisine) && (category < 0 || r[2] === category) && (!names || names.has(i))
+            && (!scores || scores.has(i))) {
+            matches.push(i);
         }
     });
-}
\ No newline at end of file
+    if (scores) {
+        matches.sort((a, b) => scores.get(b) - scores.get(a));
+    }
+    render();
+}
+
+function render() {
+    renderQueued = false;
+    const grid = document.getElementById('recipe-grid');
+    const columns = Math.max(1, Math.floor((grid.clientWidth + GRID_GAP) / (CARD_MIN_WIDTH + GRID_GAP)));
+    const rows = Math.ceil(matches.length / columns);
+    const scrolled = window.scrollY - (grid.getBoundingClientRect().top + window.scrollY);
+    const first = Math.max(0, Math.floor(scrolled / rowHeight) - OVERSCAN_ROWS);
+    const last = Math.min(rows, Math.ceil((scrolled + window.innerHeight) / rowHeight) + OVERSCAN_ROWS);
+
+    grid.style.paddingTop = `${first * rowHeight}px`;
+    grid.style.paddingBottom = `${Math.max(0, rows - last) * rowHeight}px`;
+    grid.innerHTML = matches.slice(first * columns, last * columns).map(recipeCard).join('');
+
+    const card = grid.firstElementChild;
+    if (card && Math.abs(card.offsetHeight + GRID_GAP - rowHeight) > 1) {
+        rowHeight = card.offsetHeight + GRID_GAP;
+        queueRender();
+    }
+}
+
+function queueRender() {
+    if (!renderQueued) {
+        renderQueued = true;
+        requestAnimationFrame(render);
+    }
+}
+
+fillOptions('cuisine-filter', RECIPE_INDEX.cuisines);
+fillOptions('category-filter', RECIPE_INDEX.categories);
+window.addEventListener('scroll', queueRender, { passive: true });
+window.addEventListener('resize', queueRender);
+render();
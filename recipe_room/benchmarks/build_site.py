@@ -0,0 +1,94 @@
+"""Time build_site on a synthetic vault: cold, warm (nothing changed), and after one recipe or one image changed
+
+From the recipe_room folder, run `python -m benchmarks.build_site`, and compare with an earlier run through
+`--baseline benchmarks/results/build_site_<timestamp>.json`. The site is built in a temporary folder.
+"""
+
+import argparse
+import importlib
+import logging
+import os
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+from benchmarks.corpus import write_vault
+from benchmarks.report import print_results, save_results, timed
+
+RECIPE_ROOT = Path(__file__).resolve().parents[1]
+OUTPUTS = ["assets", "recipes.html", "resources/build_state.json", "resources/cache.json", "resources/cache.sqlite"]
+
+
+def _site_folder(folder: Path):
+    # the build reads its templates from, and writes its output to, the working directory
+    resources = folder.joinpath("resources")
+    resources.mkdir(parents=True)
+    for f in RECIPE_ROOT.joinpath("resources").glob("*.*"):
+        shutil.copy(f, resources)
+    os.chdir(folder)
+
+
+def _clean():
+    for name in OUTPUTS:
+        path = Path(name)
+        if path.is_dir():
+            shutil.rmtree(path)
+        else:
+            path.unlink(missing_ok=True)
+
+
+def run(recipes_folder: Path, images_folder: Path, workers: int, repeat: int) -> dict[str, dict]:
+    sys.path.insert(0, str(RECIPE_ROOT))
+    gs = importlib.import_module("generate_site")  # after the environment points constants at the vault
+    logging.disable(logging.INFO)
+
+    recipes, images = sorted(recipes_folder.glob("*.md")), sorted(images_folder.iterdir())
+    edits = iter(range(10**6))
+
+    def _edit_recipe():
+        with open(recipes[next(edits) % len(recipes)], "a", encoding="utf-8") as fp:
+            fp.write("- taste and adjust the seasoning\n")
+
+    def _edit_image():
+        with open(images[next(edits) % len(images)], "ab") as fp:
+            fp.write(b"\0")
+
+    build = lambda: gs.build_site(recipes_folder, workers)  # noqa: E731
+    results = {"cold": timed(build, repeat, setup=_clean)}
+    results["warm"] = timed(build, repeat)
+    results["one_recipe_changed"] = timed(build, repeat, setup=_edit_recipe)
+    if images:
+        results["one_image_changed"] = timed(build, repeat, setup=_edit_image)
+    return results
+
+
+def main(recipes: int, images: int, workers: int, repeat: int, meta_cache: str, baseline: Path = None):
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        recipes_folder, images_folder = write_vault(Path(tmp, "vault"), recipes, images)
+        os.environ.update(
+            RECIPES_MARKDOWN_DIR=str(recipes_folder),
+            RECIPES_IMAGE_DIR=str(images_folder),
+            RECIPES_META_CACHE=f"resources/cache.{meta_cache}",
+        )
+        _site_folder(Path(tmp, "site"))
+        try:
+            results = run(recipes_folder, images_folder, workers, repeat)
+        finally:
+            os.chdir(cwd)
+    params = {"recipes": recipes, "images": images, "workers": workers, "repeat": repeat, "meta_cache": meta_cache}
+    print_results(results, baseline)
+    print(f"Saved to {save_results('build_site', params, results)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-n", "--recipes", type=int, default=1000)
+    parser.add_argument("-m", "--images", type=int, default=200)
+    parser.add_argument("-w", "--workers", type=int, default=1, help="processes used to build recipes")
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="timed builds per case")
+    parser.add_argument("--meta-cache", choices=["json", "sqlite"], default="json", help="recipe metadata backend")
+    parser.add_argument("--baseline", type=Path, help="earlier results file to compare against")
+    args = parser.parse_args()
+    main(args.recipes, args.images, args.workers, args.repeat, args.meta_cache, args.baseline)
@@ -0,0 +1,89 @@
+"""Synthetic Obsidian recipe vaults for the benchmarks
+
+From the recipe_room folder, run `python -m benchmarks.corpus <folder> --recipes 2000 --images 500` to keep one around
+"""
+
+import argparse
+import random
+import shutil
+from pathlib import Path
+
+try:
+    from PIL import Image
+except ImportError:  # images are then copies of the placeholder image
+    Image = None
+
+CUISINES = ["Indian", "Mexican", "SE_Asian", "Peasant", "Italian", "Mediterranean", "Other"]
+CATEGORIES = ["Breakfast", "Lunch", "Dinner", "Dessert", "Snack", "Sauce", "Drink"]
+INGREDIENTS = (
+    "onion garlic ginger tomato potato rice lentils chickpeas cumin coriander turmeric chili lime lemon cilantro "
+    "basil oregano olive oil butter flour sugar egg milk yogurt cheese beans corn tortilla pepper salt fish sauce "
+    "coconut noodles tofu chicken beef pork shrimp spinach carrot celery cabbage mushroom honey vinegar cream"
+).split()
+VERBS = ["chop", "simmer", "fry", "roast", "whisk", "fold", "season", "toast", "grind", "marinate", "blend", "bake"]
+PLACEHOLDER = Path(__file__).parents[1].joinpath("resources", "image_not_found.jpg")
+
+
+def write_image(path: Path, rng: random.Random, size: tuple[int, int] = (1600, 1200)):
+    """A photo sized jpeg, or without Pillow a unique copy of the placeholder image"""
+    if Image is None:
+        shutil.copyfile(PLACEHOLDER, path)
+        with open(path, "ab") as fp:  # bytes after the end of the jpeg, so every image has its own content hash
+            fp.write(rng.randbytes(16))
+        return
+    bands = [Image.linear_gradient("L").rotate(rng.randint(0, 359)).resize(size) for _ in range(3)]
+    Image.merge("RGB", bands).save(path, quality=85)
+
+
+def recipe_markdown(rng: random.Random, images: list[str]) -> str:
+    """A recipe note with front matter, an ingredient table, steps and image embeds"""
+    ingredients = rng.sample(INGREDIENTS, rng.randint(5, 15))
+    lines = [
+        "---",
+        f"cuisine: {rng.choice(CUISINES)}",
+        f"category: {rng.choice(CATEGORIES)}",
+        f'servings: "{rng.randint(1, 8)}"',
+        "---",
+        "## Ingredients",
+        "| Amount | Ingredient |",
+        "| --- | --- |",
+        *[f"| {rng.randint(1, 4)} cups | {i} |" for i in ingredients],
+        "",
+        "## Steps",
+    ]
+    for n in range(1, rng.randint(4, 12)):
+        lines.append(f"{n}. {rng.choice(VERBS).capitalize()} the {' and '.join(rng.sample(ingredients, 2))}.")
+    for image in images:
+        lines.append(f"![[{image}]]")
+    return "\n".join([*lines, "", "## Notes", *[f"- {rng.choice(VERBS)} {rng.choice(ingredients)}" for _ in range(3)]])
+
+
+def write_vault(folder: Path, recipes: int, images: int, seed: int = 0) -> tuple[Path, Path]:
+    """Write recipes markdown files embedding images, some of them shared between recipes
+
+    Returns:
+        tuple[Path, Path]: the recipes folder and the images folder
+    """
+    rng = random.Random(seed)
+    recipes_folder, images_folder = folder.joinpath("recipes"), folder.joinpath("images")
+    recipes_folder.mkdir(parents=True, exist_ok=True)
+    images_folder.mkdir(parents=True, exist_ok=True)
+
+    image_names = [f"Pasted image {i:05d}.jpg" for i in range(images)]
+    for name in image_names:
+        write_image(images_folder.joinpath(name), rng)
+    for i in range(recipes):
+        embeds = rng.sample(image_names, min(len(image_names), rng.randint(0, 2)))
+        title = f"{' '.join(rng.sample(INGREDIENTS, rng.randint(1, 3))).title()} {i}"
+        recipes_folder.joinpath(f"{title}.md").write_text(recipe_markdown(rng, embeds), encoding="utf-8")
+    return recipes_folder, images_folder
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("folder", type=Path, help="where to write the vault")
+    parser.add_argument("-n", "--recipes", type=int, default=1000)
+    parser.add_argument("-m", "--images", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    print(write_vault(args.folder, args.recipes, args.images, args.seed))
@@ -0,0 +1,109 @@
+"""Check that every markdown renderer matches markdown2 on recipe bodies, and time their throughput
+
+From the recipe_room folder, run `python -m benchmarks.render`, and compare with an earlier run through
+`--baseline benchmarks/results/render_<timestamp>.json`. Exits with an error when a renderer's html differs.
+"""
+
+import argparse
+import difflib
+import random
+import sys
+from pathlib import Path
+
+from benchmarks.corpus import recipe_markdown
+from benchmarks.report import print_results, save_results, timed
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import markdown_parse as md  # noqa: E402
+
+# what recipes are written with, beyond the synthetic recipes
+CASES = {
+    "paragraphs": "Some text here\nand more.\n\nSecond paragraph.\n",
+    "inline": "A **bold** and *italic* and `code` [link](https://example.com), with a hard  \nbreak.\n",
+    "escapes": 'Salt & pepper, 350°F < 400 > 300, an 8" pan, it\'s &copy; &amp; &#176;\n',
+    "headings": "# One\n## Two\n### Three\nText right after\n",
+    "text_then_list": "Ingredients:\n- a\n- b\n",
+    "text_then_heading": "Text\n## Heading\n",
+    "tight_lists": "* a\n* b\n\n3. x\n4. y\n",
+    "loose_list": "- a\n\n- b\n\n    more about b\n\n- c\n",
+    "nested_lists": "- a\n    - b\n    - c\n- d\n\n1. a\n   - b\n2. c\n    1. d\n",
+    "loose_nested_list": "- a\n\n    - b\n\n- c\n",
+    "table_aligned": "| Amount | Ingredient |\n|:--|--:|\n| 1 | **salt** |\n",
+    "table_no_pipes": "a | b\n--- | ---\n1 | 2\n",
+    "table_after_text": "Text\n| a |\n|---|\n| 1 |\n",
+    "image_alone": '## Photos\n\n<img src="/images/a b.jpg" alt="a b.jpg">\n\nText\n',
+    "image_after_text": 'Text\n<img src="/images/x.jpg" alt="x.jpg">\n',
+    "image_after_table": '| a |\n|---|\n| 1 |\n<img src="/images/x.jpg" alt="x.jpg">\n',
+    "image_in_list": '- a\n<img src="/images/x.jpg" alt="x.jpg">\n',
+    "images": '<img src="/images/x.jpg" alt="x.jpg">\n<img src="/images/y.jpg" alt="y.jpg">\n',
+    "rule_and_quote": "a\n\n---\n\n> a tip\n>\n> and another\n",
+    "indented_code": "    x = 1\n",
+    "windows_newlines": "## H\r\n- a\r\n- b\r\n",
+    "tag_lines": "#vegan #quick\n\nText\n#dinner\n\n#1 favourite\n",
+    "paren_lists": "1) a\n2) b\n\n- c\n1) d\n",
+    "comments": "<!-- a -->\nText <!-- b -->\n\n<!--\nc\n-->\n\n- d\n<!-- e -->\n",
+    "comment_after_heading": "# H\n<!-- a -->\n\nText\n",
+    "empty": "",
+}
+
+
+def recipe_bodies(n: int, seed: int = 0) -> list[str]:
+    """Bodies of synthetic recipes, their image embeds already turned into <img> tags as when parsed"""
+    rng, bodies = random.Random(seed), []
+    for i in range(n):
+        text = recipe_markdown(rng, [f"Pasted image {i}-{k}.jpg" for k in range(rng.randint(0, 2))])
+        body = text.split("---\n", 2)[2]
+        bodies.append("".join(_embed(line) for line in body.splitlines(keepends=True)))
+    return bodies
+
+
+def _embed(line: str) -> str:
+    if not line.startswith("![["):
+        return line
+    name = line.strip()[3:-2]
+    return f'<img src="/vault/images/{name}" alt="{name}">\n'
+
+
+def differences(renderer: str, documents: dict[str, str]) -> list[str]:
+    """Names of the documents the renderer doesn't render exactly like markdown2, printing a diff of each"""
+    reference, other = md.get_renderer("markdown2"), md.get_renderer(renderer)
+    different = []
+    for name, text in documents.items():
+        expected, actual = reference(text), other(text)
+        if expected != actual:
+            different.append(name)
+            diff = difflib.unified_diff(expected.splitlines(), actual.splitlines(), "markdown2", renderer, lineterm="")
+            print(f"{renderer} differs on {name}:", *diff, sep="\n  ")
+    return different
+
+
+def run(bodies: list[str], repeat: int) -> dict[str, dict]:
+    import markdown2
+
+    # markdown2.markdown is how recipes used to be rendered, building a converter per call
+    results = {"markdown2_per_call": timed(lambda: [markdown2.markdown(b, extras=["tables"]) for b in bodies], repeat)}
+    for name in md.RENDERERS:
+        results[f"{name}_batch"] = timed(lambda: md.render_markdown_batch(bodies, name), repeat)  # noqa: B023
+    return results
+
+
+def main(recipes: int, repeat: int, baseline: Path = None):
+    bodies = recipe_bodies(recipes)
+    documents = {**CASES, **{f"recipe_{i}": b for i, b in enumerate(bodies)}}
+    different = {r: differences(r, documents) for r in md.RENDERERS if r != "markdown2"}
+
+    results = run(bodies, repeat)
+    params = {"recipes": recipes, "repeat": repeat, "cases": len(CASES)}
+    print_results(results, baseline)
+    print(f"Saved to {save_results('render', params, results)}")
+    if any(different.values()):
+        sys.exit(f"Renderers differ from markdown2: {different}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-n", "--recipes", type=int, default=1000)
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="timed runs per renderer")
+    parser.add_argument("--baseline", type=Path, help="earlier results file to compare against")
+    args = parser.parse_args()
+    main(args.recipes, args.repeat, args.baseline)
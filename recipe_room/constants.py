@@ -1,7 +1,4 @@
 import os
-from dotenv import load_dotenv
-
-load_dotenv()
 
 CUISINE_COLORS = {
     "Indian": "#f39735",
@@ -14,10 +11,46 @@ CUISINE_COLORS = {
 
 RECIPE_HTML_DIR = "assets/recipes"
 RECIPE_IMAGES_DIR = "assets/images"
+GRID_INDEX = "assets/recipe_index.js"
+SEARCH_INDEX_DIR = "assets/search"
 
-RECIPES_META_CACHE = "resources/cache.json"
-RECIPE_MARKDOWN_DIR = os.environ["RECIPES_MARKDOWN_DIR"]
-RECIPES_IMAGE_SOURCE_DIR = os.environ["RECIPES_IMAGE_DIR"]
+BUILD_STATE_CACHE = "resources/build_state.json"
 DEFAULT_IMAGE = "resources/image_not_found.jpg"
+THUMBNAIL_SIZE = (480, 480)
+THUMBNAIL_FORMAT = "JPEG"  # or "WEBP" for smaller grid images
+THUMBNAIL_WEBP = True  # also a WebP copy of JPEG thumbnails, which browsers supporting WebP load instead
 RECIPE_HTML_TEMPLATE = "resources/template_recipe.html"
 OUTPUT_HTML = "recipes.html"
+STATIC_DIR = "assets"  # hand written css and js, compressed alongside the generated files
+MINIFY_HTML = True  # drop the indentation and blank lines of generated pages
+MINIFY_CSS = True  # drop the comments and extra whitespace of the stylesheets' compressed copies
+PRECOMPRESS = True  # write .gz (and, with brotli installed, .br) copies of html, js and css for static servers
+PROFILE_ENV = "RECIPES_PROFILE"  # "cprofile" or "pyinstrument", profiles every build
+BROTLI_QUALITY = 6  # of the .br files; 11 is about 10% smaller, but takes 50 times as long
+
+# settings from the environment (or a .env file), read on first use so importing the modules stays cheap and works
+# without them: constant name -> (environment variable, default), where a None default means it is required
+ENV_SETTINGS = {
+    "RECIPES_META_CACHE": ("RECIPES_META_CACHE", "resources/cache.json"),  # or a .sqlite file
+    "RECIPE_MARKDOWN_DIR": ("RECIPES_MARKDOWN_DIR", None),
+    "RECIPES_IMAGE_SOURCE_DIR": ("RECIPES_IMAGE_DIR", None),
+    "RECIPES_MARKDOWN_RENDERER": ("RECIPES_MARKDOWN_RENDERER", "markdown2"),  # or "mistune", which is faster
+}
+_dotenv_loaded = False
+
+
+def __getattr__(name: str) -> str:
+    global _dotenv_loaded
+    if name not in ENV_SETTINGS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    if not _dotenv_loaded:
+        from dotenv import load_dotenv
+
+        load_dotenv()
+        _dotenv_loaded = True
+    var, default = ENV_SETTINGS[name]
+    value = os.environ.get(var, default)
+    if value is None:
+        raise KeyError(f"Set the {var} environment variable, e.g. in a .env file")
+    globals()[name] = value  # later lookups don't come back here
+    return value
@@ -0,0 +1,53 @@
+import hashlib
+import json
+from pathlib import Path
+
+
+def file_digest(path: Path) -> str:
+    with open(path, "rb") as fp:
+        return hashlib.file_digest(fp, "sha256").hexdigest()
+
+
+def stamp(path: Path, previous: dict = None) -> dict:
+    """Fingerprint a file by size, mtime and content hash
+
+    Args:
+        path (Path): file to fingerprint
+        previous (dict, optional): the file's last known stamp
+
+    Returns:
+        dict: stamp with 'size', 'mtime_ns' and 'sha256'. The previous hash is reused when size and mtime
+        are unchanged, so untouched files are never read.
+    """
+    st = path.stat()
+    if previous and previous.get("size") == st.st_size and previous.get("mtime_ns") == st.st_mtime_ns:
+        return previous
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": file_digest(path)}
+
+
+def stamps(paths: list[Path], previous: dict = None) -> dict[str, dict]:
+    previous = previous or {}
+    return {str(p): stamp(p, previous.get(str(p))) for p in paths}
+
+
+def changed(paths: list[Path], previous: dict) -> tuple[bool, dict[str, dict]]:
+    """Compare files against their previous stamps
+
+    Args:
+        paths (list[Path]): files to check
+        previous (dict): stamps from the last build, keyed by path
+
+    Returns:
+        tuple[bool, dict[str, dict]]: whether any file was added, removed or has new content, and the current stamps
+        of the files that exist
+    """
+    current = {str(p): stamp(p, previous.get(str(p))) for p in paths if p.exists()}
+    is_changed = current.keys() != previous.keys() or any(
+        v["sha256"] != previous[k]["sha256"] for k, v in current.items()
+    )
+    return is_changed, current
+
+
+def digest(data) -> str:
+    """hash of any json serializable value"""
+    return hashlib.sha256(json.dumps(data, sort_keys=True, default=str).encode("utf-8")).hexdigest()
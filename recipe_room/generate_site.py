@@ -1,57 +1,50 @@
+import argparse
 import logging
 import json
+import os
+import time
+from functools import partial
 from pathlib import Path
-from string import Template
+from threading import Event, Thread
 import toolz as tz
-from typing import Union
-import shutil
+from typing import Optional, Union
 import markdown_parse as md
+import assets
 import constants as c
+import fingerprint as fpr
+import templates as tpl
+import output as out
+import search_index as si
+import recipe_cache as rc
+import timing as tm
 
-logging.basicConfig(level=logging.DEBUG, format="%(asctime)s - %(levelname)s - %(message)s", datefmt="%H:%M:%S")
 log = logging.getLogger(__name__)
 
-CACHE_PATH = Path(c.RECIPES_META_CACHE)
+BUILD_STATE_PATH = Path(c.BUILD_STATE_CACHE)
+GRID_TEMPLATE = "resources/template_grid_view.html"
+GRID_FIELDS = ["title", "cuisine", "category", "html_url", "grid_image", "grid_image_webp"]
 
 
-class JsonEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, Path):
-            return str(obj)
-        return super().default(obj)
+def _grid_entry(recipe_file: Path, cached: dict) -> dict:
+    # front matter only, the grid image comes from the last full build when there is one. Only what the build added
+    # is taken from it, so front matter deleted since then is gone from the grid too.
+    html_path = Path(c.RECIPE_HTML_DIR).joinpath(_rename_to_html(recipe_file))
+    built = {k: v for k, v in cached.items() if k in si.DERIVED_KEYS}
+    return {**built, **md.parse_markdown(recipe_file, meta_only=True), "html_url": str(html_path)}
 
 
-def _build_recipe_cell(data: dict) -> str:
-    title, cuisine = data["title"], data.get("cuisine", "")
-    border_color = c.CUISINE_COLORS.get(cuisine, "#e9f9fb")
-    return f"""
-        <div class="recipe-card" style="border-color: {border_color};" recipe-name="{title}" recipe-cuisine="{cuisine.lower()}" recipe-category="{data.get('category','').lower()}">
-            <a href="{data['html_url']}">
-                <img src="{data.get('grid_image', c.DEFAULT_IMAGE)}" alt="{title}">
-                <div class="caption">{title}</div>
-            </a>
-        </div>
-        """
-
-
-def build_html_grid(recipes: list[dict]) -> str:
-
-    grid_contents = ""
-    for d in recipes:
-        grid_contents += _build_recipe_cell(d)
-
-    with open("resources/template_grid_view.html", "r", encoding="utf-8") as fp:
-        return Template(fp.read()).safe_substitute(grid_contents=grid_contents)
-
-
-def _generate_recipe_grid_html(recipes_folder: Path = None, recipes_data: list[dict] = None) -> str:
+def _generate_recipe_grid_html(
+    recipes_folder: Path = None, recipes_data: list[dict] = None, search_url: str = None
+) -> str:
     if recipes_folder:
-        recipes_data = [md.parse_markdown(x) for x in sorted(recipes_folder.glob("*.md"))]
-    html_content = build_html_grid(recipes_data)
-
-    with open(c.OUTPUT_HTML, "w", encoding="utf-8") as f:
-        f.write(html_content)
-
+        cache = rc.open_cache(Path(c.RECIPES_META_CACHE)).load()
+        recipes_data = [_grid_entry(x, cache.get(x.name, {})) for x in sorted(recipes_folder.glob("*.md"))]
+        search_url = tz.get_in(["search", "url"], _load_json(BUILD_STATE_PATH))
+
+    # the page itself is a fixed size shell, the cards are rendered in the browser from the index
+    index_url = si.write_grid_index(recipes_data, search_url)
+    out.write(Path(c.OUTPUT_HTML), tpl.get(GRID_TEMPLATE).render(grid_index=index_url))
+    out.precompress(p for p in Path(c.STATIC_DIR).glob("*.*") if p.suffix in out.PRECOMPRESSED_SUFFIXES)
     return c.OUTPUT_HTML
 
 
@@ -63,59 +56,289 @@ def _rename_to_html(s: Path) -> str:
     return _clean_name(s.with_suffix(".html"))
 
 
-def _update_cache(recipes: dict):
-    with open(CACHE_PATH, mode="w", encoding="utf-8") as fp:
-        json.dump({k: tz.dissoc(v, "content") for k, v in recipes.items()}, fp, cls=JsonEncoder, indent=2)
+def _load_json(path: Path) -> dict:
+    if path.exists():
+        with open(path, "r", encoding="utf-8") as fp:
+            return json.load(fp)
+    return {}
+
 
+def _write_json(path: Path, data: dict):
+    with open(path, mode="w", encoding="utf-8") as fp:
+        json.dump(data, fp, cls=rc.JsonEncoder, indent=2)
 
-def _if_stale(recipe_file: Path, html_path: Path, cache: dict) -> float:
-    last_modified = recipe_file.stat().st_mtime
-    if last_modified != tz.get_in([recipe_file.name, "last_modified_at"], cache, 0.0):
-        return last_modified
-    if not html_path.exists():
-        return last_modified
+
+def _check_recipe(recipe_file: Path, html_path: Path, cached: dict, templates_changed: bool) -> tuple[bool, dict]:
+    """A recipe page is stale when its markdown, any embedded image or the page template changed, or when its cache
+    entry predates the search index"""
+    previous = cached.get("dependencies", {}) if cached else {}
+    stale, dependencies = fpr.changed([recipe_file, *map(Path, cached.get("images", []) if cached else [])], previous)
+    return stale or templates_changed or not html_path.exists() or "terms" not in (cached or {}), dependencies
 
 
 def _update_images(recipe: dict, images_path: Path):
     for img in recipe.get("images", []):
-        asset_path = images_path.joinpath(_clean_name(img))
-        if not asset_path.exists():
-            shutil.copy(img, asset_path)
-            log.debug(f"Copying new image to assets folder: {asset_path.name}")
+        with tm.span("image_copy"):
+            asset_path = assets.publish(img, recipe["dependencies"][str(img)]["sha256"], images_path)
         if "grid_image" not in recipe:
-            recipe["grid_image"] = str(asset_path)
+            with tm.span("thumbnail"):
+                thumb_path = assets.thumbnail(asset_path)
+                recipe["grid_image"] = str(thumb_path or asset_path)
+                if thumb_path and (webp_path := assets.webp_thumbnail(thumb_path)):
+                    recipe["grid_image_webp"] = str(webp_path)
         recipe["content"] = recipe["content"].replace(str(img), f"../images/{asset_path.name}")
 
 
-def build_site(recipes_md_folder: Union[Path, str]):
-    if isinstance(recipes_md_folder, str):
-        recipes_md_folder = Path(recipes_md_folder)
+def _build_recipe(recipe_file: Path, html_path: Path, images_path: Path, dependencies: dict) -> dict:
+    with tm.span("parse"):
+        recipe = md.parse_markdown(recipe_file)
+    with tm.span("fingerprint"):
+        recipe["dependencies"] = fpr.stamps([recipe_file, *recipe["images"]], dependencies)
+    _update_images(recipe, images_path)
+    md.as_html_file(output_path=html_path, recipe_data=recipe)
+    recipe["html_url"] = str(html_path)
+    with tm.span("search_terms"):
+        recipe["terms"] = si.recipe_terms(recipe)
+    return tz.dissoc(recipe, "content")
 
+
+def _build_recipe_timed(*job) -> tuple[dict, dict]:
+    # in a worker process, returns the stage timings along with the recipe so the parent can report them
+    return _build_recipe(*job), tm.drain()
+
+
+def _build_recipes(jobs: list[tuple], workers: int) -> list[dict]:
+    if workers > 1 and len(jobs) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+
+        # workers start from a clean slate, rather than the parent's timings at the time of the fork
+        with ProcessPoolExecutor(max_workers=workers, initializer=tm.drain) as executor:
+            chunksize = max(1, len(jobs) // (workers * 4))
+            recipes = []
+            for recipe, timings in executor.map(_build_recipe_timed, *zip(*jobs), chunksize=chunksize):
+                tm.merge(timings)
+                recipes.append(recipe)
+            return recipes
+    return [_build_recipe(*job) for job in jobs]
+
+
+def _build(recipes_md_folder: Path, recipes_data: dict, build_state: dict, workers: int) -> tuple[dict, dict, set]:
+    # one incremental build against the given state, returning the new recipes data, build state and the names of
+    # the recipes whose data changed
     recipes_html_path = Path(c.RECIPE_HTML_DIR)
     image_assets_path = Path(c.RECIPE_IMAGES_DIR)
     recipes_html_path.mkdir(parents=True, exist_ok=True)
     image_assets_path.mkdir(parents=True, exist_ok=True)
 
-    recipes_data = {}
-    if CACHE_PATH.exists():
-        with open(CACHE_PATH, "r", encoding="utf-8") as fp:
-            recipes_data = json.load(fp)
-
-    for recipe_file in sorted(recipes_md_folder.glob("*.md")):
-        html_path = recipes_html_path.joinpath(_rename_to_html(recipe_file))
-        if last_modified := _if_stale(recipe_file, html_path, recipes_data):
-            recipes_data[recipe_file.name] = md.parse_markdown(recipe_file)
-            _data = recipes_data[recipe_file.name]
-            _update_images(_data, image_assets_path)
-            md.as_html_file(output_path=html_path, recipe_data=_data)
-            _data["html_url"] = str(html_path)
-            _data["last_modified_at"] = last_modified  # or check file hash ...
-        else:
-            log.debug(f"No changes to {recipe_file.name} , skipping")
+    md.refresh_image_index()
+    recipe_files = sorted(recipes_md_folder.glob("*.md"))
+    present = {f.name for f in recipe_files}
+    cached_count = len(recipes_data)
+    for name in recipes_data.keys() - present:  # deleted recipes, whose pages would stay reachable by url
+        out.remove(recipes_html_path.joinpath(_rename_to_html(Path(name))))
+        log.debug(f"Removed the page of deleted recipe {name}")
+    recipes_data = {k: v for k, v in recipes_data.items() if k in present}
+    templates_changed, template_stamps = fpr.changed([Path(c.RECIPE_HTML_TEMPLATE)], build_state.get("templates", {}))
+    if templates_changed:
+        log.debug("Recipe template changed, rebuilding all recipes")
+    elif build_state.get("renderer", "markdown2") != c.RECIPES_MARKDOWN_RENDERER:
+        log.debug(f"Markdown renderer changed to {c.RECIPES_MARKDOWN_RENDERER}, rebuilding all recipes")
+        templates_changed = True
+
+    jobs, changed = [], set()
+    with tm.span("check"):
+        for recipe_file in recipe_files:
+            html_path = recipes_html_path.joinpath(_rename_to_html(recipe_file))
+            cached = recipes_data.get(recipe_file.name)
+            stale, dependencies = _check_recipe(recipe_file, html_path, cached, templates_changed)
+            if stale:
+                jobs.append((recipe_file, html_path, image_assets_path, dependencies))
+            else:
+                if dependencies != cached["dependencies"]:
+                    cached["dependencies"] = dependencies  # picks up touched-but-identical files
+                    changed.add(recipe_file.name)
+                log.debug(f"No changes to {recipe_file.name} , skipping")
+    tm.count("recipes_built", len(jobs))
+    tm.count("recipes_up_to_date", len(recipe_files) - len(jobs))
+
+    for job, recipe in zip(jobs, _build_recipes(jobs, workers)):
+        recipes_data[job[0].name] = recipe
+        changed.add(job[0].name)
+    # by file name, the order of --grid-only, rather than that of the cache, which new recipes are appended to
+    recipes_data = {f.name: recipes_data[f.name] for f in recipe_files}
+
+    search = build_state.get("search", {})
+    if jobs or len(recipes_data) != cached_count or not Path(c.SEARCH_INDEX_DIR).exists():
+        with tm.span("search_index"):
+            search = si.write_search_index(list(recipes_data.values()), search.get("shards", {}))
+        with tm.span("prune_assets"):
+            # the hashes of the recipes' markdown files are among them, which no asset is named after
+            hashes = (d["sha256"] for r in recipes_data.values() for d in r["dependencies"].values())
+            assets.prune(image_assets_path, hashes)
+
+    grid_digest = fpr.digest(
+        [
+            fpr.file_digest(Path(GRID_TEMPLATE)),
+            search.get("url"),
+            [[r.get(k) for k in GRID_FIELDS] for r in recipes_data.values()],
+        ]
+    )
+    outputs_exist = Path(c.OUTPUT_HTML).exists() and Path(c.GRID_INDEX).exists()
+    if grid_digest != build_state.get("grid") or not outputs_exist:
+        with tm.span("grid"):
+            _generate_recipe_grid_html(recipes_data=list(recipes_data.values()), search_url=search.get("url"))
+    else:
+        log.debug("No changes to the recipe grid, skipping")
+
+    build_state = {
+        "templates": template_stamps,
+        "renderer": c.RECIPES_MARKDOWN_RENDERER,
+        "grid": grid_digest,
+        "search": search,
+    }
+    return recipes_data, build_state, changed
+
+
+def _save_state(cache, recipes_data: dict, build_state: dict, changed: set):
+    with tm.span("cache_save"):
+        cache.save(recipes_data, changed)
+        _write_json(BUILD_STATE_PATH, build_state)
+
+
+def build_site(recipes_md_folder: Union[Path, str], workers: int = 1, profile: str = None):
+    """Convert the markdown recipes into html pages and regenerate the recipe grid, logging the time spent in each
+    stage at the end
+
+    Args:
+        recipes_md_folder (Union[Path, str]): folder containing the recipe markdown files
+        workers (int, optional): number of processes used to build stale recipes. Defaults to 1 (serial).
+        profile (str, optional): also profile the build, see timing.run. Defaults to None.
+    """
+    if isinstance(recipes_md_folder, str):
+        recipes_md_folder = Path(recipes_md_folder)
 
-    _generate_recipe_grid_html(recipes_data=list(recipes_data.values()))
-    _update_cache(recipes_data)
+    with tm.run("build_site", profile, c.PROFILE_ENV):
+        cache = rc.open_cache(Path(c.RECIPES_META_CACHE))
+        with tm.span("cache_load"):
+            recipes_data, build_state = cache.load(), _load_json(BUILD_STATE_PATH)
+        _save_state(cache, *_build(recipes_md_folder, recipes_data, build_state, workers))
+
+
+def _snapshot(folders: list[Path], files: list[Path]) -> dict[str, tuple]:
+    snapshot = {}
+    for folder in folders:
+        with os.scandir(folder) as entries:
+            for e in entries:
+                try:
+                    if e.is_file():
+                        st = e.stat()
+                        snapshot[e.path] = (st.st_size, st.st_mtime_ns)
+                except FileNotFoundError:  # removed while scanning, the next poll sees it gone
+                    pass
+    for f in files:
+        if f.exists():
+            st = f.stat()
+            snapshot[str(f)] = (st.st_size, st.st_mtime_ns)
+    return snapshot
+
+
+def _observe(folders: list[Path], files: list[Path]) -> Optional[Event]:
+    # an event set by the OS file notifications (inotify, FSEvents, ReadDirectoryChangesW) whenever something in the
+    # folders, or the files' folders, changes, or None without watchdog installed, to poll instead
+    try:
+        from watchdog.events import FileSystemEventHandler
+        from watchdog.observers import Observer
+    except ImportError:
+        log.debug("watchdog is not installed, polling for changes")
+        return None
+
+    changed = Event()
+
+    class _Handler(FileSystemEventHandler):
+        def on_any_event(self, event):
+            if event.event_type not in ("opened", "closed_no_write"):  # the build reading the recipes
+                changed.set()
+
+    observer = Observer()
+    for folder in {*folders, *(f.parent for f in files)}:
+        observer.schedule(_Handler(), str(folder))
+    observer.daemon = True
+    observer.start()
+    return changed
+
+
+def _serve(port: int):
+    from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+    handler = partial(SimpleHTTPRequestHandler, directory=os.getcwd())
+    server = ThreadingHTTPServer(("localhost", port), handler)
+    Thread(target=server.serve_forever, daemon=True).start()
+    log.info(f"Serving the site at http://localhost:{port}/{c.OUTPUT_HTML}")
+
+
+def watch(recipes_md_folder: Union[Path, str], workers: int = 1, interval: float = 0.1, port: int = None):
+    """Rebuild the site whenever a recipe, image or template changes, until interrupted. The build state stays in
+    memory between rebuilds, so an edit only costs a scan of the folders and the rebuild of the affected pages.
+    Changes are picked up from the OS file notifications when watchdog is installed, otherwise by polling.
+
+    Args:
+        recipes_md_folder (Union[Path, str]): folder containing the recipe markdown files
+        workers (int, optional): number of processes used to build stale recipes. Defaults to 1 (serial).
+        interval (float, optional): without watchdog, seconds between scans for changes. A scan stats every recipe
+            and image, about 3 ms for a thousand recipes. Defaults to 0.1.
+        port (int, optional): also serve the site over http on this port. Defaults to None (no server).
+    """
+    if isinstance(recipes_md_folder, str):
+        recipes_md_folder = Path(recipes_md_folder)
+    folders = [recipes_md_folder, Path(c.RECIPES_IMAGE_SOURCE_DIR)]
+    templates = [Path(c.RECIPE_HTML_TEMPLATE), Path(GRID_TEMPLATE)]
+
+    if port:
+        _serve(port)
+    cache = rc.open_cache(Path(c.RECIPES_META_CACHE))
+    recipes_data, build_state, snapshot = cache.load(), _load_json(BUILD_STATE_PATH), None
+    events, pending = _observe(folders, templates), True
+    try:
+        while True:
+            current = _snapshot(folders, templates) if pending else snapshot
+            if current != snapshot:
+                snapshot = current  # edits made during the rebuild are picked up by the next scan
+                start = time.perf_counter()
+                tm.drain()
+                try:
+                    recipes_data, build_state, changed = _build(recipes_md_folder, recipes_data, build_state, workers)
+                    _save_state(cache, recipes_data, build_state, changed)
+                    log.info(f"Site rebuilt in {(time.perf_counter() - start) * 1000:.0f} ms")
+                    log.debug(tm.summary("Rebuild", time.perf_counter() - start, tm.drain()))
+                except Exception as ex:  # e.g. a file caught mid-save, keep watching
+                    log.error(f"Error during rebuild, waiting for the next change.\n\n{ex}")
+            if events is None:
+                time.sleep(interval)
+            elif pending := events.wait(timeout=1):  # the timeout keeps Ctrl+C working on Windows
+                events.clear()  # before the scan, so a change made after it sets the event again
+    except KeyboardInterrupt:
+        log.info("Stopped watching")
 
 
 if __name__ == "__main__":
-    build_site(Path(c.RECIPE_MARKDOWN_DIR))
+    parser = argparse.ArgumentParser(description="Generate the recipe site from the Obsidian markdown recipes")
+    parser.add_argument("-w", "--workers", type=int, default=1, help="number of processes used to build recipes")
+    parser.add_argument("--grid-only", action="store_true", help="only refresh recipes.html from the front matter")
+    parser.add_argument("--watch", action="store_true", help="keep running and rebuild whenever a recipe changes")
+    parser.add_argument("--port", type=int, help="with --watch, also serve the site on this port")
+    parser.add_argument("--interval", type=float, default=0.1, help="with --watch and no watchdog, seconds per scan")
+    parser.add_argument("--profile", choices=["cprofile", "pyinstrument"], help="profile the build")
+    parser.add_argument("-v", "--verbose", action="store_true", help="log every recipe, built or skipped")
+    args = parser.parse_args()
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s",
+        datefmt="%H:%M:%S",
+    )
+    if args.grid_only:
+        with tm.run("grid_only", args.profile, c.PROFILE_ENV):
+            _generate_recipe_grid_html(recipes_folder=Path(c.RECIPE_MARKDOWN_DIR))
+    elif args.watch:
+        watch(Path(c.RECIPE_MARKDOWN_DIR), workers=args.workers, interval=args.interval, port=args.port)
+    else:
+        build_site(Path(c.RECIPE_MARKDOWN_DIR), workers=args.workers, profile=args.profile)
@@ -1,9 +1,14 @@
+import functools
+import io
 import logging
+import os
 from pathlib import Path
-from string import Template
+from typing import BinaryIO, Callable, Iterable
 
-import markdown2
 import constants as c
+import output as out
+import templates as tpl
+import timing as tm
 
 log = logging.getLogger(__name__)
 
@@ -12,42 +17,167 @@ def _format_title(raw_title: Path) -> str:
     return raw_title.with_suffix("").name.lower().strip()
 
 
-def _as_img(md_link: str) -> str:
-    p = Path(md_link)
-    return f'<img src="{md_link if p.exists() else c.DEFAULT_IMAGE}" alt="{p.name}">'
+def _as_img(image_path: Path) -> str:
+    return f'<img src="{image_path}" alt="{image_path.name}">'
 
 
-def parse_markdown(markdown_file: Path, meta_only: bool = False) -> dict:
-    log.debug(f"Parsing markdown file: {markdown_file}")
+_image_index = None
+
+
+def refresh_image_index() -> dict[str, Path]:
+    """List RECIPES_IMAGE_SOURCE_DIR once so image embeds resolve without a syscall each.
+    Called at the start of every build; worker processes build their own on first use.
+
+    Returns:
+        dict[str, Path]: image file name -> path
+    """
+    global _image_index
     images_src_path = Path(c.RECIPES_IMAGE_SOURCE_DIR)
-    content, images, metadata, in_contents = "", [], {}, False
-    with open(markdown_file, "r", encoding="utf-8") as fp:
-        for line in fp.readlines():
-            if in_contents:
-                if line.startswith("![["):
-                    image_path = images_src_path.joinpath(line.strip()[3:-2])
-                    if image_path.exists():
-                        images.append(image_path)
-                        content += _as_img(image_path) + "\n"
-                else:
-                    content += line + "\n"
-            elif line.startswith("---") and metadata:
-                in_contents = True
-                if meta_only:
-                    break
-            else:
-                s = line.split(":")
-                if len(s) == 2:
-                    metadata[s[0].strip()] = s[1].strip()
+    with os.scandir(images_src_path) as entries:
+        _image_index = {e.name: images_src_path.joinpath(e.name) for e in entries if e.is_file()}
+    return _image_index
+
+
+def _resolve_image(name: str) -> Path:
+    if _image_index is None:
+        refresh_image_index()
+    if image_path := _image_index.get(name):
+        return image_path
+    if "/" in name or "\\" in name:  # embeds into sub folders aren't in the listing
+        image_path = Path(c.RECIPES_IMAGE_SOURCE_DIR).joinpath(name)
+        return image_path if image_path.exists() else None
+    return None
+
+
+def _read_front_matter(fp: BinaryIO) -> dict:
+    # leaves fp at the start of the body, so only the header bytes are read
+    metadata = {}
+    if not fp.readline().startswith(b"---"):
+        fp.seek(0)
+        return metadata
+    while line := fp.readline():
+        if line.startswith(b"---"):
+            break
+        key, sep, value = line.decode("utf-8").partition(":")
+        if sep and key.strip():
+            metadata[key.strip()] = value.strip()
+    return metadata
+
+
+def _read_body(fp: BinaryIO) -> tuple[str, list[Path]]:
+    chunks, images = [], []
+    for line in io.TextIOWrapper(fp, encoding="utf-8"):
+        if line.startswith("![["):
+            if image_path := _resolve_image(line.strip()[3:-2]):
+                images.append(image_path)
+                chunks.append(_as_img(image_path) + "\n")
+        else:
+            chunks.append(line)
+    return "".join(chunks), images
 
-    return {
-        **metadata,
-        **{
-            "content": content,
+
+def parse_markdown(markdown_file: Path, meta_only: bool = False) -> dict:
+    """Parse a recipe's front matter and, unless meta_only, its body
+
+    Args:
+        markdown_file (Path): path to the recipe markdown file
+        meta_only (bool, optional): stop reading at the end of the front matter. Defaults to False.
+
+    Returns:
+        dict: front matter plus 'title' and 'markdown_url'. Full parses also have 'content' and 'images', which
+        load_body adds to a metadata-only parse when the recipe needs to be rendered.
+    """
+    log.debug(f"Parsing markdown file: {markdown_file}")
+    with open(markdown_file, "rb") as fp:
+        recipe = {
+            **_read_front_matter(fp),
             "title": _format_title(markdown_file),
             "markdown_url": markdown_file.as_uri(),
-            "images": images,
-        },
+        }
+        if not meta_only:
+            recipe["content"], recipe["images"] = _read_body(fp)
+    return recipe
+
+
+def load_body(markdown_file: Path, recipe: dict) -> dict:
+    """Add the 'content' and 'images' of the recipe body to a metadata-only parse"""
+    with open(markdown_file, "rb") as fp:
+        _read_front_matter(fp)
+        content, images = _read_body(fp)
+    return {**recipe, "content": content, "images": images}
+
+
+def _markdown2() -> Callable[[str], str]:
+    import markdown2  # the slowest import, and only needed when a recipe is rendered
+
+    return markdown2.Markdown(extras=["tables"]).convert
+
+
+def _mistune() -> Callable[[str], str]:
+    import mistune_render
+
+    return mistune_render.create_markdown()
+
+
+# markdown to html backends, by the name RECIPES_MARKDOWN_RENDERER takes
+RENDERERS = {"markdown2": _markdown2, "mistune": _mistune}
+
+
+@functools.cache
+def get_renderer(name: str = None) -> Callable[[str], str]:
+    """The markdown to html function of a backend, created once per process and reused for every recipe
+
+    Args:
+        name (str, optional): one of RENDERERS. Defaults to the RECIPES_MARKDOWN_RENDERER setting.
+
+    Returns:
+        Callable[[str], str]: renders a markdown string as html. markdown2's, when the backend's package is missing
+        or of an unsupported version.
+    """
+    name = name or c.RECIPES_MARKDOWN_RENDERER
+    if name not in RENDERERS:
+        raise ValueError(f"Unknown markdown renderer {name!r}, expected one of {', '.join(RENDERERS)}")
+    try:
+        return RENDERERS[name]()
+    except (ImportError, AttributeError) as ex:  # e.g. mistune not installed, or mistune 2
+        if name == "markdown2":
+            raise
+        log.warning(f"Can't render markdown with {name}, rendering with markdown2 instead: {ex}")
+        return get_renderer("markdown2")
+
+
+def render_markdown(content: str, renderer: str = None) -> str:
+    return get_renderer(renderer)(content)
+
+
+def render_markdown_batch(contents: Iterable[str], renderer: str = None) -> list[str]:
+    """Render many markdown strings with one lookup of the backend
+
+    Args:
+        contents (Iterable[str]): markdown of e.g. recipe bodies
+        renderer (str, optional): one of RENDERERS. Defaults to the RECIPES_MARKDOWN_RENDERER setting.
+
+    Returns:
+        list[str]: html of each, in order
+    """
+    render = get_renderer(renderer)
+    return [render(content) for content in contents]
+
+
+def _template_values(markdown_file: str = None, recipe_data: dict = None) -> dict:
+    assert markdown_file or recipe_data
+    if recipe_data is None:
+        recipe_data = parse_markdown(markdown_file)
+    elif "content" not in recipe_data:  # metadata-only parse, the body is only needed now
+        if markdown_file is None:
+            raise ValueError("recipe_data has no 'content', pass the markdown_file to read the recipe body from")
+        recipe_data = load_body(markdown_file, recipe_data)
+    return {
+        "title": recipe_data.get("title", ""),
+        "cuisine": recipe_data.get("cuisine", ""),
+        "category": recipe_data.get("category", ""),
+        "servings": recipe_data.get("servings", "").replace('"', ""),
+        "content": render_markdown(recipe_data["content"]),
     }
 
 
@@ -61,25 +191,11 @@ def convert_recipe_to_html(markdown_file: str = None, recipe_data: dict = None)
     Returns:
         str: html string of the content
     """
-    assert markdown_file or recipe_data
-    if markdown_file:
-        recipe_data = parse_markdown(markdown_file)
-
-    # Convert Markdown to HTML
-    html_content = markdown2.markdown(recipe_data["content"], extras=["tables"])
-
-    with open(c.RECIPE_HTML_TEMPLATE, "r", encoding="utf-8") as fp:
-        return Template(fp.read()).safe_substitute(
-            title=recipe_data.get("title", ""),
-            cuisine=recipe_data.get("cuisine", ""),
-            category=recipe_data.get("category", ""),
-            servings=recipe_data.get("servings", "").replace('"', ""),
-            content=html_content,
-        )
+    return tpl.get(c.RECIPE_HTML_TEMPLATE).render(**_template_values(markdown_file, recipe_data))
 
 
 def as_html_file(output_path: Path, markdown_file: str = None, recipe_data: dict = None) -> Path:
-    """Convert a recipe from markdown format (as a file or parsed dict) into html, optionally saving as a file
+    """Convert a recipe from markdown format (as a file or parsed dict) into html, and write it unless unchanged
 
     Args:
         output_path (pathlib.Path): path to which the resulting html is written
@@ -89,12 +205,12 @@ def as_html_file(output_path: Path, markdown_file: str = None, recipe_data: dict
     Returns:
         Path: path to html file if successfully created, otherwise None
     """
-    html = convert_recipe_to_html(markdown_file=markdown_file, recipe_data=recipe_data)
+    with tm.span("render"):
+        html = convert_recipe_to_html(markdown_file, recipe_data)
     try:
-        with open(output_path, "w", encoding="utf-8") as fp:
-            fp.write(html)
-            log.debug(f"Successfully generated recipe html file: {output_path}")
+        with tm.span("write"):
+            if out.write(output_path, html):
+                log.debug(f"Successfully generated recipe html file: {output_path}")
             return output_path
     except Exception as ex:
         log.error(f"Error during html file creation for {markdown_file}.\n\n{ex}")
-    return html
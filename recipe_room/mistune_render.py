@@ -0,0 +1,124 @@
+"""Markdown rendering with mistune, laid out like markdown2's output
+
+mistune parses and renders several times faster than markdown2. This renderer and parser rules reproduce markdown2's
+html (with the "tables" extra) for what recipes are made of: headings, paragraphs, tables, lists, emphasis, links,
+html comments and the <img> tags of image embeds, along with markdown2's quirks: a # needs no space after it to start
+a heading (so an Obsidian tag line like "#vegan #quick" is one), and "1)" doesn't start a list.
+
+Known differences: underscores inside words are left alone (markdown2 makes snake_case_word an emphasis), fenced code
+becomes a code block (markdown2 needs its "fenced-code-blocks" extra), raw html blocks other than images and comments
+are laid out the mistune way, and so are comments in the two places markdown2 keeps the whitespace around them: at
+the very start of a page after a blank line, and indented under a list after a blank line.
+"""
+
+import re
+
+import mistune
+from mistune.list_parser import LIST_PATTERN, parse_list
+
+_ENTITY = re.compile(r"&(?!#?\w+;)")
+# markdown2's heading, with or without a space after the #s, its lists, of which "1)" isn't one, and the end of a
+# comment block
+_ATX_HEADING = r"^(?P<atx_1>#{1,6})[ \t]*(?P<atx_2>.+?)[ \t]*(?<!\\)#*$"
+_LIST = LIST_PATTERN.replace("[.)]", r"\.")
+_COMMENT_START = re.compile(r"(?:\A|\n[ \t]*\n|^#[^\n]+\n) {0,3}\Z", re.M)
+_COMMENT_END = re.compile(r"<!--(?:(?!-->).)*-->[ \t]*(?:\n[ \t]*\n|\n?$(?![\s\S]))", re.DOTALL)
+
+
+def _parse_atx_heading(block, m, state) -> int:
+    state.append_token({"type": "heading", "text": m.group("atx_2"), "attrs": {"level": len(m.group("atx_1"))}})
+    return m.end() + 1
+
+
+def _parse_list(block, m, state) -> int:
+    # markdown2 only starts a top level list after a blank line, the lines after a paragraph's text continue it
+    if state.parent is None and (end_pos := state.append_paragraph()):
+        return end_pos
+    return parse_list(block, m, state)
+
+
+def _comment_blocks_end(src: str) -> int:
+    # markdown2 stops looking for comment blocks at the first comment that isn't at the start of a line after a blank
+    # line (or a heading, which it has made a block of its own by then), the later ones are all part of paragraphs
+    start = 0
+    while (pos := src.find("<!--", start)) != -1 and (end := src.find("-->", pos)) != -1:
+        if not _COMMENT_START.search(src, 0, pos):
+            return pos
+        start = end + 3
+    return len(src)
+
+
+def _parse_raw_html(block, m, state) -> int:
+    # markdown2 only takes a comment for a block between blank lines, otherwise it is part of a paragraph's text
+    if m.group(0).strip() == "<!--":
+        if end_pos := state.append_paragraph():
+            return end_pos
+        pos = m.end() - 4
+        if state.parent is None:  # positions in the whole document
+            if "comment_blocks_end" not in state.env:
+                state.env["comment_blocks_end"] = _comment_blocks_end(state.src)
+            if pos >= state.env["comment_blocks_end"]:
+                return None
+        if not _COMMENT_END.match(state.src, pos):
+            return None
+    return block.parse_raw_html(m, state)
+
+
+def _parse_block_html(block, m, state) -> int:
+    # what ends a list item, but a comment on the line after an item's text is part of it to markdown2
+    if m.group(0).strip() == "<!--":
+        return None
+    return block.parse_block_html(m, state)
+
+
+class Markdown2Renderer(mistune.HTMLRenderer):
+    def __init__(self):
+        super().__init__(escape=False)
+
+    def _blocks(self, tokens, state) -> str:
+        # markdown2 separates blocks with a blank line
+        return "\n\n".join(self.render_token(t, state).rstrip("\n") for t in tokens if t["type"] != "blank_line")
+
+    def __call__(self, tokens, state) -> str:
+        return (self._blocks(tokens, state) or "<p></p>") + "\n"
+
+    def render_token(self, token: dict, state) -> str:
+        if token["type"] == "list_item":  # blocks of an item on their own lines, and nothing before </li>
+            html, tight = "", True
+            for child in token["children"]:
+                if child["type"] != "blank_line":
+                    html += ("\n" if tight else "\n\n") if html else ""
+                    html += self.render_token(child, state).rstrip("\n")
+                    tight = child["type"] == "block_text"
+            return "<li>" + html + "</li>\n"
+        if token["type"] == "block_quote":
+            lines = self._blocks(token["children"], state).splitlines(keepends=True)
+            return "<blockquote>\n" + "".join(f"  {line}" for line in lines) + "\n</blockquote>\n"
+        return super().render_token(token, state)
+
+    def text(self, text: str) -> str:
+        # quotes stay as typed, and entities written in the recipe are kept
+        return _ENTITY.sub("&amp;", text).replace("<", "&lt;").replace(">", "&gt;")
+
+    def block_code(self, code: str, info: str = None) -> str:
+        return super().block_code(code if code.endswith("\n") else code + "\n", info)
+
+    def block_html(self, html: str) -> str:
+        if html.startswith("<img"):  # an image embed on its own, which markdown2 wraps as a paragraph
+            return "<p>" + html.strip() + "</p>\n"
+        return html + "\n"
+
+    def table_cell(self, text: str, align: str = None, head: bool = False) -> str:
+        tag = "th" if head else "td"
+        style = f' style="text-align:{align};"' if align else ""
+        return f"  <{tag}{style}>{text}</{tag}>\n"
+
+
+def create_markdown() -> mistune.Markdown:
+    """A markdown to html function, which can be reused for any number of documents"""
+    md = mistune.Markdown(renderer=Markdown2Renderer(), plugins=[mistune.plugins.import_plugin("table")])
+    md.block.register("atx_heading", _ATX_HEADING, _parse_atx_heading)
+    md.block.register("list", _LIST, _parse_list)
+    md.block.register("raw_html", None, _parse_raw_html)
+    md.block.register("block_html", None, _parse_block_html)
+    return md
@@ -0,0 +1,168 @@
+import gzip
+import logging
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from functools import cache
+from pathlib import Path
+from typing import Iterable
+
+import constants as c
+import timing as tm
+
+log = logging.getLogger(__name__)
+
+PRECOMPRESSED_SUFFIXES = {".html", ".js", ".css"}
+COMPRESSED_SUFFIXES = [".gz", ".br"]
+_PRESERVED = re.compile(r"<(pre|textarea)\b.*?</\1>", re.DOTALL | re.IGNORECASE)
+_INDENT = re.compile(r"\n\s+")
+# css strings, kept as is, then comments, whitespace around punctuation and other runs of whitespace
+_CSS_TOKENS = re.compile(r"(\"(?:\\.|[^\"\\])*\"|'(?:\\.|[^'\\])*')|/\*.*?\*/|\s*([{};,>])\s*|(:)\s+|\s+", re.DOTALL)
+
+
+@cache
+def _brotli():
+    try:
+        import brotli
+    except ImportError:  # only .gz files are written
+        log.debug("brotli is not installed, skipping .br files")
+        return None
+    return brotli
+
+
+def _siblings(path: Path) -> dict[str, Path]:
+    # the compressed copies of a file, by suffix
+    if not c.PRECOMPRESS or path.suffix not in PRECOMPRESSED_SUFFIXES:
+        return {}
+    return {s: path.with_name(path.name + s) for s in (COMPRESSED_SUFFIXES if _brotli() else [".gz"])}
+
+
+def _unproduced(path: Path, siblings: dict[str, Path]) -> list[Path]:
+    # compressed copies a build no longer writes, e.g. since PRECOMPRESS was turned off or brotli uninstalled, which
+    # static servers would keep serving once the file changes
+    return [path.with_name(path.name + s) for s in COMPRESSED_SUFFIXES if s not in siblings]
+
+
+def minify_html(html: str) -> str:
+    """Drop indentation and blank lines, which browsers collapse anyway, except within <pre> and <textarea>"""
+    chunks, pos = [], 0
+    for m in _PRESERVED.finditer(html):
+        chunks += [_INDENT.sub("\n", html[pos : m.start()]), m.group()]
+        pos = m.end()
+    chunks.append(_INDENT.sub("\n", html[pos:]))
+    return "".join(chunks).lstrip()
+
+
+def _css_token(m: re.Match) -> str:
+    if kept := m.group(1) or m.group(2) or m.group(3):
+        return kept
+    return "" if m.group().startswith("/*") else " "
+
+
+def minify_css(css: str) -> str:
+    """Drop comments and the whitespace that doesn't separate anything, leaving strings as they are"""
+    return _CSS_TOKENS.sub(_css_token, css).strip()
+
+
+def _minified(path: Path, data: bytes) -> bytes:
+    # what a static file's compressed copies hold: hand written stylesheets stay readable, their copies are minified.
+    # Javascript is left as is, which takes a parser to minify safely (strings, template and regex literals).
+    if c.MINIFY_CSS and path.suffix == ".css":
+        return minify_css(data.decode("utf-8")).encode("utf-8")
+    return data
+
+
+def _compressed(data: bytes) -> dict[str, bytes]:
+    # mtime=0 so the same content always compresses to the same bytes
+    versions = {".gz": gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli := _brotli():
+        versions[".br"] = brotli.compress(data, quality=c.BROTLI_QUALITY)
+    return versions
+
+
+def _replace(path: Path, data: bytes):
+    # a per-process temp file renamed over the output, so readers (and parallel workers) never see a partial file
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    try:
+        with open(tmp, "wb") as fp:
+            fp.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+
+def _unchanged(path: Path, data: bytes) -> bool:
+    try:
+        if path.stat().st_size != len(data):
+            return False
+        with open(path, "rb") as fp:
+            return fp.read() == data
+    except FileNotFoundError:
+        return False
+
+
+def write(path: Path, text: str) -> bool:
+    """Write a site file unless it already has this content, so unchanged files keep their mtime (for rsync and
+    http caching). Html, js and css files also get gzip and brotli compressed copies, when PRECOMPRESS is set, for
+    static servers to serve as is.
+
+    Args:
+        path (Path): output file
+        text (str): its content; html is minified first when MINIFY_HTML is set
+
+    Returns:
+        bool: whether the file was written
+    """
+    if c.MINIFY_HTML and path.suffix == ".html":
+        text = minify_html(text)
+    data, siblings = text.encode("utf-8"), _siblings(path)
+    if _unchanged(path, data):
+        tm.count("outputs_unchanged")
+        if all(p.exists() for p in siblings.values()):
+            return False
+    else:
+        _replace(path, data)
+        tm.count("bytes_written", len(data))
+        for p in _unproduced(path, siblings):
+            p.unlink(missing_ok=True)
+    if siblings:
+        with tm.span("compress"):
+            for suffix, compressed in _compressed(data).items():
+                _replace(siblings[suffix], compressed)
+    return True
+
+
+def write_many(files: dict[Path, str], workers: int = 4) -> int:
+    """Write site files as by write, on several threads (compression releases the GIL)
+
+    Returns:
+        int: number of files written
+    """
+    if len(files) < 2:
+        return sum(write(p, t) for p, t in files.items())
+    with ThreadPoolExecutor(workers) as executor:
+        return sum(executor.map(write, files.keys(), files.values()))
+
+
+def remove(path: Path):
+    """Delete a site file along with its compressed copies"""
+    for p in (path, *(path.with_name(path.name + s) for s in COMPRESSED_SUFFIXES)):
+        p.unlink(missing_ok=True)
+
+
+def precompress(paths: Iterable[Path]):
+    """Add compressed copies of static files, e.g. hand written css and js, that are missing or older than the file.
+    Stylesheets are minified first when MINIFY_CSS is set.
+    """
+    for path in paths:
+        mtime, siblings = path.stat().st_mtime_ns, _siblings(path)
+        for p in _unproduced(path, siblings):
+            if p.exists() and p.stat().st_mtime_ns < mtime:
+                p.unlink()
+        if all(p.exists() and p.stat().st_mtime_ns >= mtime for p in siblings.values()):
+            continue
+        with tm.span("compress"):
+            for suffix, compressed in _compressed(_minified(path, path.read_bytes())).items():
+                _replace(siblings[suffix], compressed)
+        log.debug(f"Compressed {path}")
@@ -0,0 +1,101 @@
+import json
+import logging
+import os
+from contextlib import closing
+from pathlib import Path
+
+log = logging.getLogger(__name__)
+
+# bump when the shape of the cached recipe data changes, older caches are then discarded (a full rebuild)
+SCHEMA_VERSION = 1
+
+
+class JsonEncoder(json.JSONEncoder):
+    def default(self, obj):
+        if isinstance(obj, Path):
+            return str(obj)
+        return super().default(obj)
+
+
+def _dumps(data) -> str:
+    return json.dumps(data, cls=JsonEncoder, separators=(",", ":"))
+
+
+class JsonCache:
+    """All recipes in a single json file, rewritten atomically when any of them changed"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.names = set()
+
+    def load(self) -> dict[str, dict]:
+        if not self.path.exists():
+            return {}
+        with open(self.path, "r", encoding="utf-8") as fp:
+            data = json.load(fp)
+        if data.get("version") != SCHEMA_VERSION:
+            log.debug(f"{self.path} was written by an older version, rebuilding all recipes")
+            return {}
+        self.names = set(data["recipes"])
+        return data["recipes"]
+
+    def save(self, recipes: dict[str, dict], changed: set[str]):
+        if not changed and self.names == recipes.keys():
+            return
+        tmp = self.path.with_name(f".{self.path.name}.{os.getpid()}.tmp")
+        with open(tmp, "w", encoding="utf-8") as fp:
+            fp.write(_dumps({"version": SCHEMA_VERSION, "recipes": recipes}))
+        os.replace(tmp, self.path)
+        self.names = set(recipes)
+
+
+class SqliteCache:
+    """One row per recipe, so a build only writes the recipes it changed"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.names = set()
+
+    def _connect(self) -> "sqlite3.Connection":
+        import sqlite3  # only needed by this backend
+
+        conn = sqlite3.connect(self.path)
+        if conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            with conn:
+                conn.execute("DROP TABLE IF EXISTS recipes")
+                conn.execute("CREATE TABLE recipes (name TEXT PRIMARY KEY, data TEXT NOT NULL)")
+                conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        return conn
+
+    def load(self) -> dict[str, dict]:
+        with closing(self._connect()) as conn:
+            recipes = {name: json.loads(data) for name, data in conn.execute("SELECT name, data FROM recipes")}
+        self.names = set(recipes)
+        return recipes
+
+    def save(self, recipes: dict[str, dict], changed: set[str]):
+        removed = self.names - recipes.keys()
+        if not changed and not removed:
+            return
+        with closing(self._connect()) as conn, conn:  # a single transaction, so a failed build leaves no partial write
+            conn.executemany("INSERT OR REPLACE INTO recipes VALUES (?, ?)", [(n, _dumps(recipes[n])) for n in changed])
+            conn.executemany("DELETE FROM recipes WHERE name = ?", [(n,) for n in removed])
+        self.names = set(recipes)
+
+
+BACKENDS = {".json": JsonCache, ".sqlite": SqliteCache, ".db": SqliteCache}
+
+
+def open_cache(path: Path):
+    """Cache backend for the recipe metadata, chosen by the file's suffix
+
+    Args:
+        path (Path): cache file, e.g. resources/cache.json or resources/cache.sqlite
+
+    Returns:
+        a backend with load() -> dict of recipe data by markdown file name, and save(recipes, changed) which writes
+        the changed recipes and drops the ones no longer present
+    """
+    if path.suffix not in BACKENDS:
+        raise ValueError(f"No recipe cache backend for '{path.suffix}' files, use one of {sorted(BACKENDS)}")
+    return BACKENDS[path.suffix](path)
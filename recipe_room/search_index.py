@@ -0,0 +1,145 @@
+import json
+import re
+from collections import defaultdict
+from pathlib import Path
+
+import constants as c
+import fingerprint as fpr
+import output as out
+
+
+# keys added by the build rather than written in the recipe's front matter
+DERIVED_KEYS = {
+    "content",
+    "markdown_url",
+    "images",
+    "dependencies",
+    "html_url",
+    "grid_image",
+    "grid_image_webp",
+    "terms",
+}
+STOPWORDS = {"a", "an", "and", "as", "at", "be", "by", "for", "in", "into", "is", "it", "of", "on", "or", "the", "to"}
+TAG_RE = re.compile(r"<[^>]+>")
+
+
+def tokenize(s: str) -> list[str]:
+    return re.findall(r"[a-z0-9]+", s.lower())
+
+
+def recipe_terms(recipe: dict) -> dict[str, int]:
+    """Term counts of a recipe's body and front matter, kept in the cache so that only rebuilt recipes are
+    tokenized again
+    """
+    fields = [str(v) for k, v in recipe.items() if k not in DERIVED_KEYS]
+    terms = {}
+    for t in tokenize(" ".join([TAG_RE.sub(" ", recipe.get("content", "")), *fields])):
+        if t not in STOPWORDS:
+            terms[t] = terms.get(t, 0) + 1
+    return terms
+
+
+def build_grid_index(recipes: list[dict], search_url: str = None) -> dict:
+    """Compact index of everything the recipe grid shows and filters on
+
+    Args:
+        recipes (list[dict]): recipe data, in grid order
+        search_url (str, optional): url of the full text search manifest
+
+    Returns:
+        dict: the 'search' url, 'recipes' rows of [title, cuisine id, category id, html url, grid image, WebP grid
+        image or None], the 'cuisines' and 'categories' the ids refer to, cuisine 'colors' and the name 'tokens'
+        mapped to the ids of their recipes
+    """
+    cuisines = sorted({r.get("cuisine", "") for r in recipes})
+    categories = sorted({r.get("category", "") for r in recipes})
+    cuisine_ids, category_ids = {v: i for i, v in enumerate(cuisines)}, {v: i for i, v in enumerate(categories)}
+
+    rows, tokens = [], defaultdict(list)
+    for i, r in enumerate(recipes):
+        rows.append(
+            [
+                r["title"],
+                cuisine_ids[r.get("cuisine", "")],
+                category_ids[r.get("category", "")],
+                r["html_url"],
+                r.get("grid_image", c.DEFAULT_IMAGE),
+                r.get("grid_image_webp"),
+            ]
+        )
+        for t in sorted(set(tokenize(r["title"]))):
+            tokens[t].append(i)
+
+    return {
+        "search": search_url,
+        "recipes": rows,
+        "cuisines": cuisines,
+        "categories": categories,
+        "colors": {k: v for k, v in c.CUISINE_COLORS.items() if k in cuisine_ids},
+        "tokens": tokens,
+    }
+
+
+def write_grid_index(recipes: list[dict], search_url: str = None) -> str:
+    """Write the grid index as a script, which (unlike fetching a .json file) also loads from file:// urls
+
+    Returns:
+        str: url of the script, versioned by its content so browsers never use a stale copy
+    """
+    data = json.dumps(build_grid_index(recipes, search_url), separators=(",", ":"))
+    path = Path(c.GRID_INDEX)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    out.write(path, f"const RECIPE_INDEX = {data};\n")
+    return f"{path.as_posix()}?v={fpr.digest(data)[:12]}"
+
+
+def _script_args(*args) -> str:
+    return ",".join(json.dumps(a, separators=(",", ":")) for a in args)
+
+
+def _script(call: str, args: str) -> str:
+    return f"{call}({args});\n"
+
+
+def write_search_index(recipes: list[dict], previous: dict[str, str]) -> dict:
+    """Write the full text index as one script per leading character of its terms, plus a manifest, so a query
+    only loads the shards of its words. Postings refer to recipes by their position in the manifest's 'docs'.
+
+    Args:
+        recipes (list[dict]): recipe data with their 'terms'
+        previous (dict[str, str]): shard versions from the last build; unchanged shards are not rewritten
+
+    Returns:
+        dict: the new shard versions under 'shards' and the manifest's versioned 'url'
+    """
+    folder = Path(c.SEARCH_INDEX_DIR)
+    folder.mkdir(parents=True, exist_ok=True)
+
+    docs, lengths, postings = [], [], defaultdict(list)
+    for i, r in enumerate(recipes):
+        terms = r.get("terms", {})
+        docs.append(r["html_url"])
+        lengths.append(sum(terms.values()))
+        for t, n in terms.items():
+            postings[t].extend((i, n))
+
+    shards = defaultdict(dict)
+    for t in sorted(postings):
+        shards[t[0]][t] = postings[t]
+
+    # versions of the scripts' content, for cache busting urls
+    versions, scripts = {}, {}
+    for key, terms in shards.items():
+        args = _script_args(key, terms)
+        shard_path = folder.joinpath(f"{key}.js")
+        versions[key] = fpr.digest(args)[:12]
+        if previous.get(key) != versions[key] or not shard_path.exists():
+            scripts[shard_path] = _script("registerSearchShard", args)
+    for key in previous.keys() - versions.keys():
+        out.remove(folder.joinpath(f"{key}.js"))
+
+    manifest = {"path": folder.as_posix(), "docs": docs, "lengths": lengths, "shards": versions}
+    args = _script_args(manifest)
+    scripts[folder.joinpath("manifest.js")] = _script("registerSearchManifest", args)
+    out.write_many(scripts)
+    return {"shards": versions, "url": f"{folder.as_posix()}/manifest.js?v={fpr.digest(args)[:12]}"}
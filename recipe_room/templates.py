@@ -0,0 +1,70 @@
+from pathlib import Path
+from string import Template
+from typing import Iterable, Union
+
+_registry = {}
+
+
+def _compile(text: str) -> list:
+    # split the template once into literal chunks and (placeholder, raw text) pairs
+    parts, pos = [], 0
+    for m in Template.pattern.finditer(text):
+        parts.append(text[pos : m.start()])
+        if m.group("escaped") is not None:
+            parts.append(Template.delimiter)
+        elif name := m.group("named") or m.group("braced"):
+            parts.append((name, m.group()))
+        else:
+            parts.append(m.group())  # invalid placeholder, left as is like safe_substitute
+        pos = m.end()
+    parts.append(text[pos:])
+
+    merged = []
+    for p in parts:
+        if isinstance(p, str) and merged and isinstance(merged[-1], str):
+            merged[-1] += p
+        elif p != "":
+            merged.append(p)
+    return merged
+
+
+class CompiledTemplate:
+    """A string.Template split into chunks so it can be rendered without re-parsing, with the semantics of
+    safe_substitute. Values are either strings or iterables of string chunks, which are joined in turn.
+    """
+
+    def __init__(self, text: str):
+        self.parts = _compile(text)
+
+    def _chunks(self, values: dict) -> Iterable[str]:
+        for p in self.parts:
+            if isinstance(p, str):
+                yield p
+            elif p[0] not in values:
+                yield p[1]
+            elif isinstance(v := values[p[0]], str):
+                yield v
+            else:
+                yield from v
+
+    def render(self, **values: Union[str, Iterable[str]]) -> str:
+        return "".join(self._chunks(values))
+
+
+def get(path: Union[Path, str]) -> CompiledTemplate:
+    """Load and compile a template, reusing the compiled version until the file changes
+
+    Args:
+        path (Union[Path, str]): path to the template file
+
+    Returns:
+        CompiledTemplate: the compiled template
+    """
+    path = Path(path)
+    st = path.stat()
+    key = (st.st_size, st.st_mtime_ns)
+    cached = _registry.get(path)
+    if cached is None or cached[0] != key:
+        with open(path, "r", encoding="utf-8") as fp:
+            cached = _registry[path] = (key, CompiledTemplate(fp.read()))
+    return cached[1]
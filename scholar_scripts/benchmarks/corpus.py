@@ -0,0 +1,189 @@
+"""Synthetic exports and saved pages, at sizes well beyond the samples in data/, for the benchmarks
+
+From the scholar_scripts folder, run `python -m benchmarks.corpus data/generated/corpus` to keep a corpus around
+"""
+
+import argparse
+import random
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pandas as pd
+
+FIXTURES = Path("data/fixtures")
+GOODREADS_SAMPLE = Path("data/goodreads_export.csv")
+
+WORDS = (
+    "market capital labour value state power class history theory progress network machine learning data model "
+    "economy growth innovation entrepreneur credit money profit wage trade policy democracy socialism reform law "
+    "science method evidence argument author chapter reader idea culture nature mind language system order"
+).split()
+SHELVES = ["business", "history", "politics", "science", "philosophy", "fiction", "lex", "non-fiction"]
+
+
+def _sentence(rng: random.Random, low: int = 6, high: int = 30) -> str:
+    return " ".join(rng.choices(WORDS, k=rng.randint(low, high))).capitalize() + "."
+
+
+def _titles(rng: random.Random, n: int) -> list[tuple[str, str]]:
+    return [(f"{_sentence(rng, 2, 5)[:-1].title()} {i}", f"{rng.choice(WORDS).title()} Author{i}") for i in range(n)]
+
+
+def write_clippings(path: Path, clippings: int, books: int = 50, seed: int = 0) -> Path:
+    """A Kindle 'My Clippings.txt' with notes, repeated exports and extended highlights, as a Kindle writes them"""
+    rng, added = random.Random(seed), datetime(2024, 3, 9, 14, 56)
+    titles = _titles(rng, books)
+    with path.open(mode="w", encoding="utf-8") as fp:
+        for i in range(clippings):
+            title, author = rng.choice(titles)
+            page, location = rng.randint(1, 400), rng.randint(10, 9000)
+            added += timedelta(seconds=rng.randint(5, 600))
+            stamp = f"Added on {added:%A, %B} {added.day}, {added.year} {added.hour % 12 or 12}:{added:%M:%S %p}"
+            text = _sentence(rng)
+            if rng.random() < 0.2:
+                fp.write(f"\ufeff{title} ({author})\n- Your Note on page {page} | Location {location} | {stamp}\n\n")
+                fp.write(f"{_sentence(rng)}\n==========\n")
+            repeats = 2 if rng.random() < 0.05 else 1
+            if rng.random() < 0.05:  # highlight extended after the fact, exported twice
+                fp.write(f"\ufeff{title} ({author})\n- Your Highlight on page {page} | Location {location}-")
+                fp.write(f"{location} | {stamp}\n\n{text}\n==========\n")
+                text = f"{text} {_sentence(rng)}"
+            for _ in range(repeats):
+                fp.write(f"\ufeff{title} ({author})\n- Your Highlight on page {page} | Location {location}-")
+                fp.write(f"{location + 2} | {stamp}\n\n{text}\n==========\n")
+    return path
+
+
+def write_highlight_export(path: Path, highlights: int, seed: int = 0) -> Path:
+    """A copy of a read.amazon.com/notebook page for one book"""
+    rng = random.Random(seed)
+    with path.open(mode="w", encoding="utf-8") as fp:
+        fp.write("Your Kindle Notes For:\nSynthetic Book\nSome Author\n\n")
+        for i in range(highlights):
+            fp.write(f"{rng.choice(['Yellow', 'Blue', 'Pink'])} highlight | Page: {i // 4 + 1}\n{_sentence(rng)}\n")
+            if rng.random() < 0.2:
+                fp.write(f"Note: {_sentence(rng)}\n")
+            fp.write("                \n\n")
+    return path
+
+
+def write_goodreads_csv(path: Path, books: int, seed: int = 0) -> Path:
+    """A Goodreads library export, with the columns of the sample export"""
+    rng = random.Random(seed)
+    columns = pd.read_csv(GOODREADS_SAMPLE, nrows=0).columns
+    shelf = rng.choices(["read", "to-read", "currently-reading"], weights=[6, 3, 1], k=books)
+    day, titles = datetime(2005, 1, 1), enumerate(_titles(rng, books))
+    frame = pd.DataFrame(
+        {
+            "Book Id": range(1, books + 1),
+            "Title": [f"{t}: A {rng.choice(WORDS).title()} Story (Series, #{i % 7 + 1})" for i, (t, _) in titles],
+            "Author": [f"{rng.choice(WORDS).title()} {rng.choice('ABCDEFG')}. Writer{i}" for i in range(books)],
+            "My Rating": [rng.randint(0, 5) if s == "read" else 0 for s in shelf],
+            "Date Read": [
+                f"{day + timedelta(days=rng.randint(0, 7000)):%Y/%m/%d}" if s == "read" and rng.random() < 0.9 else None
+                for s in shelf
+            ],
+            "Bookshelves": [", ".join(rng.sample(SHELVES, rng.randint(0, 3))) or None for _ in shelf],
+            "Exclusive Shelf": shelf,
+        }
+    )
+    frame.reindex(columns=columns).to_csv(path, index=False)
+    return path
+
+
+def write_overdrive_pages(folder: Path, pages: int, seed: int = 0) -> list[Path]:
+    """Overdrive search result pages, the saved fixtures with different titles"""
+    rng = random.Random(seed)
+    folder.mkdir(parents=True, exist_ok=True)
+    found = FIXTURES.joinpath("overdrive_search_found.html").read_text(encoding="utf-8")
+    not_found = FIXTURES.joinpath("overdrive_search_not_found.html").read_text(encoding="utf-8")
+    paths = []
+    for i in range(pages):
+        page = found.replace('"title": "Upstream"', f'"title": "{_sentence(rng, 1, 4)[:-1]}"') if i % 4 else not_found
+        paths.append(folder.joinpath(f"overdrive_search_{i}.html"))
+        paths[-1].write_text(page, encoding="utf-8")
+    return paths
+
+
+def write_youtube_page(path: Path, videos: int, seed: int = 0) -> Path:
+    """A long, scrolled YouTube search or channel capture"""
+    rng = random.Random(seed)
+    svg = '<svg viewBox="0 0 24 24">' + '<path d="M0 0h24v24H0z"/>' * 40 + "</svg>"
+    with path.open(mode="w", encoding="utf-8") as fp:
+        fp.write('<html><head><title>YouTube</title></head><body><div id="contents">\n')
+        for i in range(videos):
+            if i % 5:
+                age = f"{rng.randint(1, 11)} months"
+                length = f"{rng.randint(0, 2)} hours, {rng.randint(1, 59)} minutes"
+            else:
+                age = f"{rng.randint(1, 9)} years"
+                length = f"{rng.randint(1, 59)} minutes, {rng.randint(1, 59)} seconds"
+            title = f"{_sentence(rng, 3, 9)[:-1]} | Part {i}"
+            label = f"{title} by Channel {rng.randint(1, 9_999_999):,} views {age} ago {length}"
+            fp.write(
+                f'<ytd-video-renderer><div id="dismissible"><ytd-thumbnail><img src="/vi/{i}.jpg">{svg}</ytd-thumbnail>'
+                f'<h3><a id="video-title" class="yt-simple-endpoint" title="{title}" href="/watch?v={i:011d}" '
+                f'aria-label="{label}">{title}</a></h3></div></ytd-video-renderer>\n'
+            )
+        fp.write("</div></body></html>\n")
+    return path
+
+
+def write_lex_page(path: Path, episodes: int, seed: int = 0) -> Path:
+    """The lexfridman.com/podcast page with 'show all' episodes"""
+    rng = random.Random(seed)
+    with path.open(mode="w", encoding="utf-8") as fp:
+        fp.write('<!DOCTYPE html><html><head><title>Lex Fridman Podcast</title></head><body>\n')
+        fp.write('<div class="grid grid-main">\n')
+        for i in range(episodes, 0, -1):
+            fp.write(
+                f'<div class="guest"><a href="/ep{i}"><img src="/thumb{i}.jpg"></a>'
+                f'<div class="vid-title">#{i} – {_sentence(rng, 3, 8)[:-1]}</div>'
+                f'<div class="vid-person">{rng.choice(WORDS).title()} Guest{i}</div>'
+                f'<div class="vid-materials"><a href="https://youtube.com/watch?v={i}">Video</a> · '
+                f'<a href="https://lexfridman.com/ep{i}">Episode</a> · '
+                f'<a href="https://lexfridman.com/ep{i}-transcript">Transcript</a></div>'
+                f'<script>window.episode = {{id: {i}, notes: "{_sentence(rng, 100, 200)}"}};</script></div>\n'
+            )
+        fp.write("</div><footer>Lex Fridman</footer></body></html>\n")
+    return path
+
+
+SCALES = {
+    "clippings": 20_000,
+    "highlights": 5_000,
+    "goodreads": 10_000,
+    "overdrive_pages": 50,
+    "youtube_videos": 5_000,
+    "lex_episodes": 1_000,
+}
+
+
+def write_corpus(folder: Path, scale: float = 1.0, seed: int = 0) -> dict[str, Path]:
+    """Write every kind of input, sized by SCALES times scale
+
+    Returns:
+        dict[str, Path]: paths of the generated files (the overdrive pages by their folder)
+    """
+    folder.mkdir(parents=True, exist_ok=True)
+    n = {k: max(1, int(v * scale)) for k, v in SCALES.items()}
+    write_overdrive_pages(folder.joinpath("overdrive"), n["overdrive_pages"], seed)
+    return {
+        "clippings": write_clippings(folder.joinpath("My Clippings.txt"), n["clippings"], seed=seed),
+        "highlights": write_highlight_export(folder.joinpath("synthetic_highlights.txt"), n["highlights"], seed),
+        "goodreads": write_goodreads_csv(folder.joinpath("goodreads_export.csv"), n["goodreads"], seed),
+        "overdrive": folder.joinpath("overdrive"),
+        "youtube": write_youtube_page(folder.joinpath("synthetic_YouTube.html"), n["youtube_videos"], seed),
+        "lex": write_lex_page(folder.joinpath("Lex_Fridman_Podcast.html"), n["lex_episodes"], seed),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("folder", type=Path, help="where to write the corpus")
+    parser.add_argument("-s", "--scale", type=float, default=1.0, help="multiplier of the default sizes")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    for name, path in write_corpus(args.folder, args.scale, args.seed).items():
+        size = sum(f.stat().st_size for f in path.iterdir()) if path.is_dir() else path.stat().st_size
+        print(f"{name:12} {size / 1e6:8.1f} MB  {path}")
@@ -0,0 +1,56 @@
+"""Micro-benchmark of the Overdrive search page extraction, offline against the saved pages in data/fixtures
+
+From the scholar_scripts folder, run `python -m benchmarks.overdrive_extract`
+"""
+
+import argparse
+import threading
+import timeit
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import scholar_scripts.overdrive as od
+
+FIXTURES = Path("data/fixtures")
+
+
+class _FixtureHandler(SimpleHTTPRequestHandler):
+    # stand-in for {library}.overdrive.com, answering every search with the fixture named in the title query
+    def do_GET(self):
+        title = self.path.split("query=")[1].split("&")[0]
+        self.path = f"/overdrive_search_{title}.html"
+        super().do_GET()
+
+    def log_message(self, *args):
+        pass
+
+
+def _bench(fn, number: int) -> float:
+    return min(timeit.repeat(fn, number=number, repeat=5)) / number * 1e6
+
+
+def main(number: int):
+    for page in sorted(FIXTURES.glob("overdrive_search_*.html")):
+        content = page.read_bytes()
+        assert od._extract_media_items(content) == od._media_items_from_soup(content.decode("utf-8")), page.name
+        fast = _bench(partial(od._extract_media_items, content), number)
+        soup = _bench(partial(od._media_items_from_soup, content.decode("utf-8")), number)
+        print(f"{page.name:40} fast {fast:9.1f} us   soup {soup:9.1f} us   x{soup / fast:.0f}")
+
+    server = ThreadingHTTPServer(("localhost", 0), partial(_FixtureHandler, directory=str(FIXTURES)))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host = f"http://localhost:{server.server_port}"
+    od.OVERDRIVE_SEARCH_URL = host + "/{library}/search?query={title}&creator={author}"
+    try:
+        result = od.search_for_media("mary+oliver", "found", od.LibraryCode.BOISE)
+        assert result["query_status_code"] == 200 and result["title"] == "Upstream", result
+        print(f"search_for_media against the local stand-in server: {result['query_time'] * 1000:.1f} ms")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-n", "--number", type=int, default=200, help="extractions per timing")
+    main(parser.parse_args().number)
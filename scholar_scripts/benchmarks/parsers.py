@@ -0,0 +1,75 @@
+"""Time each export and page parser against a synthetic corpus, saving the results as json in benchmarks/results
+
+From the scholar_scripts folder, run `python -m benchmarks.parsers`, and compare with an earlier run through
+`--baseline benchmarks/results/parsers_<timestamp>.json`
+"""
+
+import argparse
+import logging
+import tempfile
+from pathlib import Path
+
+import pandas as pd
+
+import scholar_scripts.html_parsing as hp
+import scholar_scripts.kindle_parse as kp
+import scholar_scripts.overdrive as od
+import scholar_scripts.utils as u
+from benchmarks.corpus import SCALES, write_corpus
+from benchmarks.report import print_results, save_results, timed
+from scholar_scripts.highlight_store import HighlightStore
+
+
+def run(corpus: dict[str, Path], work: Path, repeat: int) -> dict[str, dict]:
+    checkpoint, store = work.joinpath("checkpoint.json"), work.joinpath("highlights.sqlite")
+    goodreads = pd.read_csv(corpus["goodreads"])
+    read = goodreads.query("`Exclusive Shelf` != 'to-read'")
+    pages = [p.read_bytes() for p in sorted(corpus["overdrive"].glob("*.html"))]
+    clippings = kp.parse_myclippings_file(corpus["clippings"])
+    markdown_folder = work.joinpath("books")
+    markdown_folder.mkdir(exist_ok=True)
+    u.write_markdown_files(read, markdown_folder)  # so the timed runs find every file up to date
+
+    return {
+        "kindle_myclippings": timed(lambda: kp.parse_myclippings_file(corpus["clippings"]), repeat),
+        "kindle_new_clippings_cold": timed(
+            lambda: kp.parse_new_clippings(corpus["clippings"], checkpoint),
+            repeat,
+            setup=lambda: checkpoint.unlink(missing_ok=True),
+        ),
+        "kindle_new_clippings_none_new": timed(lambda: kp.parse_new_clippings(corpus["clippings"], checkpoint), repeat),
+        "kindle_highlight_export": timed(lambda: kp.parse_highlight_file(corpus["highlights"]), repeat),
+        "highlight_store_ingest": timed(
+            lambda: HighlightStore(store).ingest_grouped(clippings), repeat, setup=lambda: store.unlink(missing_ok=True)
+        ),
+        "goodreads_read_csv": timed(lambda: pd.read_csv(corpus["goodreads"]), repeat),
+        "goodreads_clean_queries": timed(
+            lambda: (u.clean_authors(goodreads["Author"]), u.clean_titles(goodreads["Title"])), repeat
+        ),
+        "goodreads_markdown": timed(lambda: u.as_markdown(read), repeat),
+        "goodreads_write_unchanged": timed(lambda: u.write_markdown_files(read, markdown_folder), repeat),
+        "overdrive_extract": timed(lambda: [od._extract_media_items(p) for p in pages], repeat),
+        "youtube_video_list": timed(lambda: hp.parse_youtube_video_list(corpus["youtube"]), repeat),
+        "lex_episodes": timed(lambda: hp.parse_lex_episodes_html(corpus["lex"]), repeat),
+    }
+
+
+def main(scale: float, repeat: int, corpus_folder: Path = None, baseline: Path = None):
+    logging.disable(logging.WARNING)  # bad dates and such are part of the corpus
+    with tempfile.TemporaryDirectory() as tmp:
+        work = Path(tmp)
+        corpus = write_corpus(corpus_folder or work.joinpath("corpus"), scale)
+        results = run(corpus, work, repeat)
+    params = {"scale": scale, "repeat": repeat, **{k: max(1, int(v * scale)) for k, v in SCALES.items()}}
+    print_results(results, baseline)
+    print(f"Saved to {save_results('parsers', params, results)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-s", "--scale", type=float, default=1.0, help="multiplier of the corpus sizes in corpus.py")
+    parser.add_argument("-r", "--repeat", type=int, default=5, help="timed runs per case")
+    parser.add_argument("--corpus", type=Path, help="also keep the generated corpus in this folder")
+    parser.add_argument("--baseline", type=Path, help="earlier results file to compare against")
+    args = parser.parse_args()
+    main(args.scale, args.repeat, args.corpus, args.baseline)
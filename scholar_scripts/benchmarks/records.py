@@ -0,0 +1,128 @@
+"""Compare the memory held by clippings and search results as dicts and as the slotted records of records.py
+
+From the scholar_scripts folder, run `python -m benchmarks.records`. Measures what each representation keeps
+allocated with tracemalloc, times parsing and building a DataFrame, and exits with an error when the records don't
+hold the same data as the dicts.
+"""
+
+import argparse
+import json
+import sys
+import tempfile
+import tracemalloc
+from dataclasses import fields
+from pathlib import Path
+from typing import Callable
+
+import pandas as pd
+
+import scholar_scripts.kindle_parse as kp
+import scholar_scripts.overdrive as od
+from benchmarks.corpus import write_clippings, write_overdrive_pages
+from benchmarks.report import print_results, save_results, timed
+from scholar_scripts.records import Clipping, MediaAvailability
+
+
+def retained(fn: Callable):
+    """Call fn, returning its result and the bytes still allocated for it once it returns"""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = fn()
+        return result, tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+
+
+def write_search_job(path: Path, work: Path, results: int) -> Path:
+    """A SearchJob results file, of the saved Overdrive pages' results with different queries"""
+    items = [od._extract_media_items(p.read_bytes()) for p in write_overdrive_pages(work.joinpath("pages"), 8)]
+    with path.open(mode="w", encoding="utf-8") as fp:
+        for i in range(results):
+            meta = {
+                "query_status_code": 200,
+                "query_time": 0.25 + i % 100 / 1000,
+                "library": ["spl", "dallaslibrary", "boise"][i % 3],
+                "query_url": f"https://boise.overdrive.com/search/title?query=title+{i}&creator=author+{i}",
+                "query_title": f"title {i}",
+                "query_author": f"author {i}",
+                "requested_on": "2024-06-16",
+            }
+            found = items[i % len(items)]
+            result = {**od._parse_media_item(list(found.values())), **meta} if found else meta
+            if i % 10 == 1:  # a media type without fields of its own, kept in the records' extra dicts
+                result = {**result, "magazine_available": 1, "magazine_owned": 2}
+            fp.write(json.dumps(result) + "\n")
+    return path
+
+
+def _as_records_dict(cls: type, d: dict) -> dict:
+    # the dict a record's as_dict returns for a parser's dict: a key for every field, None where the dict has none
+    return {**{f.name: None for f in fields(cls) if f.name != "extra"}, **d}
+
+
+def _same_frame(dicts: pd.DataFrame, records: pd.DataFrame) -> bool:
+    # records have a column for every field, the dicts only for the keys some row has
+    return records[dicts.columns].equals(dicts) and records.drop(columns=dicts.columns).isna().all().all()
+
+
+def run(clippings_path: Path, job: od.SearchJob, repeat: int) -> tuple[dict[str, dict], dict[str, dict], list[str]]:
+    memory, different = {}, []
+
+    grouped, memory["clippings_dicts"] = retained(lambda: kp.parse_myclippings_file(clippings_path))
+    records, memory["clippings_records"] = retained(lambda: kp.parse_myclippings_records(clippings_path))
+    if {t: [r.as_dict() for r in rs] for t, rs in records.items()} != {
+        t: [_as_records_dict(Clipping, n) for n in notes] for t, notes in grouped.items()
+    }:
+        different.append("clippings")
+    flat_dicts = [n for notes in grouped.values() for n in notes]
+    flat_records = [n for notes in records.values() for n in notes]
+    if not _same_frame(pd.DataFrame(flat_dicts), Clipping.to_frame(flat_records)):
+        different.append("clippings_frame")
+
+    results, memory["search_results_dicts"] = retained(job.results)
+    availability, memory["search_results_records"] = retained(job.records)
+    if [r.as_dict() for r in availability] != [_as_records_dict(MediaAvailability, r) for r in results]:
+        different.append("search_results")
+    if not _same_frame(pd.DataFrame(results), MediaAvailability.to_frame(availability)):
+        different.append("search_results_frame")
+
+    rows = {"clippings": len(flat_dicts), "search_results": len(results)}
+    memory = {k: {"bytes": v, "per_row": v / rows[k.rsplit("_", 1)[0]]} for k, v in memory.items()}
+    timings = {
+        "clippings_dicts": timed(lambda: kp.parse_myclippings_file(clippings_path), repeat),
+        "clippings_records": timed(lambda: kp.parse_myclippings_records(clippings_path), repeat),
+        "clippings_frame_dicts": timed(lambda: pd.DataFrame(flat_dicts), repeat),
+        "clippings_frame_records": timed(lambda: Clipping.to_frame(flat_records), repeat),
+        "search_results_dicts": timed(job.results, repeat),
+        "search_results_records": timed(job.records, repeat),
+        "search_results_frame_dicts": timed(lambda: pd.DataFrame(results), repeat),
+        "search_results_frame_records": timed(lambda: MediaAvailability.to_frame(availability), repeat),
+    }
+    return memory, timings, different
+
+
+def main(clippings: int, results: int, repeat: int, baseline: Path = None):
+    with tempfile.TemporaryDirectory() as tmp:
+        work = Path(tmp)
+        clippings_path = write_clippings(work.joinpath("My Clippings.txt"), clippings)
+        job = od.SearchJob(write_search_job(work.joinpath("search_job.jsonl"), work, results), [])
+        memory, timings, different = run(clippings_path, job, repeat)
+
+    for case, m in memory.items():
+        print(f"{case:32} {m['bytes'] / 2**20:10.1f} MiB {m['per_row']:8.0f} bytes per row")
+    print_results(timings, baseline)
+    params = {"clippings": clippings, "search_results": results, "repeat": repeat}
+    print(f"Saved to {save_results('records', params, {**timings, 'memory': memory})}")
+    if different:
+        sys.exit(f"Records don't match the dicts for {different}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-c", "--clippings", type=int, default=50_000)
+    parser.add_argument("-n", "--results", type=int, default=50_000, help="search results in the SearchJob file")
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="timed runs per case")
+    parser.add_argument("--baseline", type=Path, help="earlier results file to compare against")
+    args = parser.parse_args()
+    main(args.clippings, args.results, args.repeat, args.baseline)
@@ -0,0 +1,78 @@
+"""Timing and machine readable results shared by the benchmarks
+
+recipe_room and scholar_scripts keep identical copies of this module, change both.
+"""
+
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Callable
+
+RESULTS_DIR = Path(__file__).parent.joinpath("results")
+
+
+def timed(fn: Callable, repeat: int = 5, setup: Callable = None) -> dict:
+    """Time repeated calls of fn, calling setup (untimed) before each
+
+    Returns:
+        dict: the 'runs' in seconds and their 'min' and 'median'
+    """
+    runs = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        fn()
+        runs.append(time.perf_counter() - start)
+    return {"runs": runs, "min": min(runs), "median": statistics.median(runs)}
+
+
+def _git_commit() -> str:
+    try:
+        out = subprocess.run(["git", "rev-parse", "HEAD"], cwd=RESULTS_DIR.parent, capture_output=True, text=True)
+        return out.stdout.strip() or None
+    except OSError:
+        return None
+
+
+def save_results(suite: str, params: dict, results: dict[str, dict], folder: Path = RESULTS_DIR) -> Path:
+    """Write a run's results as json, named by suite and time, so runs can be compared over time
+
+    Args:
+        suite (str): name of the benchmark
+        params (dict): corpus sizes and options of the run
+        results (dict[str, dict]): timings by case, as returned by timed
+
+    Returns:
+        Path: the results file
+    """
+    started = datetime.now()
+    record = {
+        "suite": suite,
+        "timestamp": started.isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "params": params,
+        "results": results,
+    }
+    folder.mkdir(parents=True, exist_ok=True)
+    path = folder.joinpath(f"{suite}_{started:%Y%m%d-%H%M%S}.json")
+    path.write_text(json.dumps(record, indent=2), encoding="utf-8")
+    return path
+
+
+def print_results(results: dict[str, dict], baseline: Path = None):
+    """Print the median of each case and, given an earlier results file, the change against it"""
+    before = json.loads(baseline.read_text(encoding="utf-8"))["results"] if baseline else {}
+    for case, r in results.items():
+        line = f"{case:32} {r['median'] * 1000:10.1f} ms"
+        if case in before:
+            line += f"   x{r['median'] / before[case]['median']:.2f} vs {baseline.name}"
+        print(line)
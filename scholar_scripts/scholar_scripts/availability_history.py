@@ -0,0 +1,143 @@
+from __future__ import annotations
+
+import sqlite3
+from contextlib import closing
+from typing import TYPE_CHECKING, Iterable
+
+import scholar_scripts.utils as u
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+DEFAULT_HISTORY_PATH = "data/generated/availability_history.sqlite"
+
+MEDIA_TYPES = ["ebook", "audiobook"]
+KEY_COLUMNS = ["library", "query_author", "query_title"]
+VALUE_COLUMNS = ["title", "author"] + [
+    f"{media}_{field}" for media in MEDIA_TYPES for field in ["owned", "available", "held", "estimated_wait"]
+]
+COLUMNS = ["day", *KEY_COLUMNS, *VALUE_COLUMNS]
+
+_COLUMN_DEFS = ",\n    ".join(f"{c} {'TEXT' if c in ('title', 'author') else 'REAL'}" for c in VALUE_COLUMNS)
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS snapshots (
+    day TEXT NOT NULL,
+    library TEXT NOT NULL,
+    query_author TEXT NOT NULL,
+    query_title TEXT NOT NULL,
+    {_COLUMN_DEFS},
+    PRIMARY KEY (library, query_author, query_title, day)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS snapshots_day ON snapshots (day);
+CREATE TABLE IF NOT EXISTS latest (
+    day TEXT NOT NULL,
+    library TEXT NOT NULL,
+    query_author TEXT NOT NULL,
+    query_title TEXT NOT NULL,
+    {_COLUMN_DEFS},
+    PRIMARY KEY (library, query_author, query_title)
+) WITHOUT ROWID;
+"""
+
+_PLACEHOLDERS = ", ".join("?" for _ in COLUMNS)
+_UPSERT_LATEST = f"""INSERT INTO latest VALUES ({_PLACEHOLDERS})
+    ON CONFLICT (library, query_author, query_title) DO UPDATE SET
+    {", ".join(f"{c} = excluded.{c}" for c in ["day", *VALUE_COLUMNS])}
+    WHERE excluded.day >= latest.day"""
+
+
+class AvailabilityHistory:
+    """Every Overdrive search result in SQLite, a snapshot per day, with the latest result of each search kept in its
+    own table. Answers what changed between two days, e.g. which titles became available, without reloading the
+    searches' csv files.
+    """
+
+    def __init__(self, path: str = DEFAULT_HISTORY_PATH):
+        self.path = path
+        with closing(self._connect()) as conn, conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    def _read(self, sql: str, params: tuple = ()) -> pd.DataFrame:
+        import pandas as pd
+
+        with closing(self._connect()) as conn:
+            return pd.read_sql_query(sql, conn, params=params)
+
+    def record(self, results: Iterable[dict], day: str = None) -> int:
+        """Add search results to the snapshot of the day they were requested on, replacing earlier results of the
+        same search that day. Failed requests are skipped.
+
+        Args:
+            results (Iterable[dict]): results of search_for_media, search_libraries or a SearchJob
+            day (str, optional): YYYY-MM-DD of the snapshot. Defaults to each result's 'requested_on', or today.
+
+        Returns:
+            int: number of results recorded
+        """
+        rows = [
+            (day or r.get("requested_on") or u.now_iso(), *[r.get(c) for c in COLUMNS[1:]])
+            for r in results
+            if r and r.get("query_status_code", 200) == 200
+        ]
+        with closing(self._connect()) as conn, conn:
+            conn.executemany(f"INSERT OR REPLACE INTO snapshots VALUES ({_PLACEHOLDERS})", rows)
+            conn.executemany(_UPSERT_LATEST, rows)
+        return len(rows)
+
+    def record_csv(self, csv_path: str, day: str = None) -> int:
+        """Add the results saved by the library search notebook, e.g. data/generated/overdrive_search_2024-06-16.csv"""
+        import pandas as pd
+
+        df = pd.read_csv(csv_path).reindex(columns=[*COLUMNS[1:], "requested_on", "query_status_code"])
+        return self.record(df.astype(object).where(df.notna(), None).to_dict(orient="records"), day)
+
+    def days(self) -> list[str]:
+        with closing(self._connect()) as conn:
+            return [r[0] for r in conn.execute("SELECT DISTINCT day FROM snapshots ORDER BY day")]
+
+    def latest(self, library: str = None) -> pd.DataFrame:
+        """The most recent result of every search, optionally of one library (e.g. 'boise'). Query it like a search
+        results DataFrame, e.g. history.latest().query(od.Query.AUDIOS_AVAIL)
+        """
+        return self._read("SELECT * FROM latest WHERE ? IS NULL OR library = ?", (library, library))
+
+    def as_of(self, day: str, library: str = None) -> pd.DataFrame:
+        """The most recent result of every search on or before a day, optionally of one library"""
+        return self._read(
+            f"""SELECT s.* FROM snapshots s JOIN (
+                SELECT {", ".join(KEY_COLUMNS)}, MAX(day) AS day FROM snapshots
+                WHERE day <= ? AND (? IS NULL OR library = ?) GROUP BY {", ".join(KEY_COLUMNS)}
+            ) USING ({", ".join(KEY_COLUMNS)}, day)""",
+            (day, library, library),
+        )
+
+    def changes(self, since: str = None, until: str = None, library: str = None) -> pd.DataFrame:
+        """What changed between the state on two days, for every search in the later state
+
+        Args:
+            since (str, optional): YYYY-MM-DD of the earlier state, e.g. the day of the previous run. Defaults to the
+                last recorded day before the later state. Without one, e.g. on the first run, every search is new.
+            until (str, optional): YYYY-MM-DD of the later state. Defaults to the latest results.
+            library (str, optional): only this library, e.g. 'boise'. Defaults to all.
+
+        Returns:
+            pd.DataFrame: searches with at least one change, with their earlier values suffixed '_before' and a flag
+            per change and media type: '{media}_became_available', '{media}_wait_dropped' and '{media}_new_copies'
+        """
+        if since is None:
+            days = self.days()
+            earlier = [d for d in days if d < (until or days[-1])] if days else []
+            since = earlier[-1] if earlier else ""  # before any day, an empty state
+        after = self.as_of(until, library) if until else self.latest(library)
+        before = self.as_of(since, library)
+        df = after.merge(before, on=KEY_COLUMNS, how="left", suffixes=("", "_before"))
+        flags = []
+        for media in MEDIA_TYPES:
+            df[f"{media}_became_available"] = (df[f"{media}_available"] >= 1) & ~(df[f"{media}_available_before"] >= 1)
+            df[f"{media}_wait_dropped"] = df[f"{media}_estimated_wait"] < df[f"{media}_estimated_wait_before"]
+            df[f"{media}_new_copies"] = df[f"{media}_owned"] > df[f"{media}_owned_before"].fillna(0)
+            flags += [f"{media}_became_available", f"{media}_wait_dropped", f"{media}_new_copies"]
+        return df[df[flags].any(axis=1)].reset_index(drop=True)
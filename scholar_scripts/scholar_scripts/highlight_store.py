@@ -0,0 +1,105 @@
+import sqlite3
+from contextlib import closing
+from typing import Iterable
+
+from scholar_scripts.kindle_parse import clipping_key
+
+DEFAULT_STORE_PATH = "data/generated/highlights.sqlite"
+COLUMNS = ["title", "page", "location", "text", "note"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS highlights (
+    id INTEGER PRIMARY KEY,
+    key TEXT UNIQUE NOT NULL,
+    title TEXT,
+    page INTEGER,
+    location INTEGER,
+    text TEXT,
+    note TEXT,
+    source TEXT
+);
+CREATE INDEX IF NOT EXISTS highlights_title_page ON highlights (title, page);
+CREATE INDEX IF NOT EXISTS highlights_page ON highlights (page);
+CREATE VIRTUAL TABLE IF NOT EXISTS highlights_fts USING fts5(
+    title, text, note, content='highlights', content_rowid='id'
+);
+CREATE TRIGGER IF NOT EXISTS highlights_ai AFTER INSERT ON highlights BEGIN
+    INSERT INTO highlights_fts (rowid, title, text, note) VALUES (new.id, new.title, new.text, new.note);
+END;
+CREATE TRIGGER IF NOT EXISTS highlights_ad AFTER DELETE ON highlights BEGIN
+    INSERT INTO highlights_fts (highlights_fts, rowid, title, text, note)
+    VALUES ('delete', old.id, old.title, old.text, old.note);
+END;
+"""
+
+
+class HighlightStore:
+    """Kindle highlights and notes in SQLite, indexed by title and page and full text searchable"""
+
+    def __init__(self, path: str = DEFAULT_STORE_PATH):
+        self.path = path
+        with closing(self._connect()) as conn, conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _query(self, sql: str, params: tuple = ()) -> list[dict]:
+        with closing(self._connect()) as conn:
+            return [{k: r[k] for k in COLUMNS if r[k] is not None} for r in conn.execute(sql, params)]
+
+    def ingest(self, notes: Iterable[dict], title: str = None, source: str = None) -> int:
+        """Add highlights, skipping any already in the store
+
+        Args:
+            notes (Iterable[dict]): highlights as parsed by kindle_parse, with 'text' and optional 'page', 'location'
+                and 'note'
+            title (str, optional): title for highlights without one, e.g. from parse_highlight_file. Defaults to None.
+            source (str, optional): where the highlights came from, e.g. the file name. Defaults to None.
+
+        Returns:
+            int: number of highlights added
+        """
+        rows = []
+        for n in notes:
+            n = {"title": title, **n} if title and "title" not in n else n
+            rows.append((clipping_key(n), *[n.get(k) for k in COLUMNS], source))
+        with closing(self._connect()) as conn, conn:
+            # rowcount rather than total_changes, which also counts the full text index rows the trigger writes
+            cursor = conn.executemany("INSERT OR IGNORE INTO highlights VALUES (NULL, ?, ?, ?, ?, ?, ?, ?)", rows)
+            return cursor.rowcount
+
+    def ingest_grouped(self, grouped: dict[str, list[dict]], source: str = None) -> int:
+        """Add highlights grouped by title, as returned by parse_myclippings_file and parse_new_clippings"""
+        return self.ingest((n for notes in grouped.values() for n in notes), source=source)
+
+    def titles(self) -> list[str]:
+        with closing(self._connect()) as conn:
+            return [r[0] for r in conn.execute("SELECT DISTINCT title FROM highlights ORDER BY title")]
+
+    def by_title(self, title: str, first_page: int = None, last_page: int = None) -> list[dict]:
+        """Highlights of a title in page order, optionally within a page range"""
+        return self._query(
+            """SELECT * FROM highlights WHERE title = ? AND (? IS NULL OR page >= ?) AND (? IS NULL OR page <= ?)
+            ORDER BY page, location, id""",
+            (title, first_page, first_page, last_page, last_page),
+        )
+
+    def search(self, query: str, title: str = None, limit: int = 50) -> list[dict]:
+        """Full text search of highlights and notes, best matches first
+
+        Args:
+            query (str): FTS5 query, e.g. 'capitalism' or '"creative destruction"' or 'market* NOT free'
+            title (str, optional): only search this title. Defaults to None.
+            limit (int, optional): maximum number of results. Defaults to 50.
+
+        Returns:
+            list[dict]: matching highlights
+        """
+        return self._query(
+            """SELECT h.* FROM highlights_fts JOIN highlights h ON h.id = highlights_fts.rowid
+            WHERE highlights_fts MATCH ? AND (? IS NULL OR h.title = ?) ORDER BY bm25(highlights_fts) LIMIT ?""",
+            (query, title, title, limit),
+        )
@@ -1,14 +1,39 @@
+from __future__ import annotations
+
 import re
+from concurrent.futures import ProcessPoolExecutor
 from datetime import date, timedelta
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Iterator
+
+try:
+    from lxml import etree
+except ImportError:  # fall back to building the whole page with BeautifulSoup
+    etree = None
 
-import pandas as pd
-from bs4 import BeautifulSoup, element
+if TYPE_CHECKING:  # pandas and BeautifulSoup are imported by the parsers, so importing this module stays fast
+    import pandas as pd
+    from bs4 import element
 
 YOUTUBE_NUM_VIEWS_RGX = re.compile(r"(\d{1,3}(?:,\d{3})*)\s+views")
 YOUTUBE_UPLOADED_AGO = re.compile(r"(\d+\s+years?)?(\d+\s+months?)?(\d+\s+weeks?)?(\d+\s+days?)?\s+ago")
 YOUTUBE_VIDEO_LEN = re.compile(r"(?:(\d+)\s+hours?)?,?\s*(?:(\d+)\s+minutes?)?,?\s*(?:(\d+)\s+seconds?)?$")
 
 
+def _iterparse(html_path: str, tag: str, events: tuple[str, ...] = ("end",)) -> Iterator[tuple[str, "etree._Element"]]:
+    # the whole page is still parsed, but only elements with this tag are handed back to python
+    with open(html_path, mode="rb") as fp:
+        yield from etree.iterparse(fp, events=events, tag=tag, html=True, encoding="utf-8", huge_tree=True)
+
+
+def _free(el: "etree._Element"):
+    # drop a parsed element's content and everything parsed before it, so memory stays flat however long the page
+    el.clear(keep_tail=True)
+    for node in [el, *el.iterancestors()]:
+        while node.getprevious() is not None:
+            del node.getparent()[0]
+
+
 def _parse_lex_episode(div: element.Tag) -> dict:
     ep = {}
     for d in div.select('div[class^="vid-"]'):
@@ -24,6 +49,40 @@ def _parse_lex_episode(div: element.Tag) -> dict:
     return ep
 
 
+def _parse_lex_episode_element(div: "etree._Element") -> dict:
+    ep = {}
+    for d in div.iterdescendants("div"):
+        if not d.get("class", "").startswith("vid-"):
+            continue
+        match d.get("class").split()[0][4:]:
+            case "title":
+                ep["title"] = "".join(d.itertext())
+            case "person":
+                ep["guest"] = "".join(d.itertext())
+            case "materials":
+                for a in d.iter("a"):
+                    ep["".join(a.itertext()).lower()] = a.get("href")
+    return ep
+
+
+def _stream_lex_episodes(html_path: str) -> Iterator[dict]:
+    grid, in_guest = None, 0
+    for event, el in _iterparse(html_path, "div", events=("start", "end")):
+        is_guest = grid is not None and "guest" in el.get("class", "").split()
+        if event == "start":
+            if grid is None and el.get("class") == "grid grid-main":
+                grid = el
+            in_guest += is_guest
+            continue
+        if el is grid:
+            return  # nothing after the episode grid is needed
+        if is_guest:
+            in_guest -= 1
+            yield _parse_lex_episode_element(el)
+            if not in_guest:
+                _free(el)
+
+
 def parse_lex_episodes_html(html_path: str) -> pd.DataFrame:
     """Parse the html export from https://lexfridman.com/podcast
 
@@ -35,6 +94,13 @@ def parse_lex_episodes_html(html_path: str) -> pd.DataFrame:
     Returns:
         pd.DataFrame: Table with the title, guest, and links to video, webpage, and transcript
     """
+    import pandas as pd
+
+    if etree is not None:
+        return pd.DataFrame(list(_stream_lex_episodes(html_path))[::-1])
+
+    from bs4 import BeautifulSoup
+
     with open(html_path, mode="r", encoding="utf-8") as fp:
         soup = BeautifulSoup(fp.read(), "html.parser")
 
@@ -51,25 +117,63 @@ def _publish_date(today, age_str: str) -> str:
     return (today - timedelta(days=num)).strftime("%B %Y")
 
 
-def _parse_youtube_anchor(today: date, a: element.Tag) -> dict:
+def _parse_youtube_anchor(today: date, attrs: dict) -> dict:
 
-    lbl = a.attrs.get("aria-label")
+    lbl = attrs.get("aria-label")
     nviews = next(iter(YOUTUBE_NUM_VIEWS_RGX.findall(lbl)), None)
     dur = next(iter(YOUTUBE_VIDEO_LEN.findall(lbl)), None)
     age = next(iter(YOUTUBE_UPLOADED_AGO.findall(lbl)), [])
     age = next(iter([a for a in age if a]), None)
     return {
-        "title": f"[{a.attrs.get('title').replace('|',':')}]({a.attrs.get('href')})",
+        "title": f"[{attrs.get('title').replace('|',':')}]({attrs.get('href')})",
         "num_views": nviews.strip(),
         "duration (m)": f"{60*(int(dur[0]) if dur[0] else 0) + (int(dur[1]) if dur[1] else 0)} minutes",
         "published_in": _publish_date(today, age) if age else "",
     }
 
 
+def _stream_youtube_videos(today: date, html_path: str) -> Iterator[dict]:
+    for _, el in _iterparse(html_path, "a"):
+        if el.get("id") == "video-title":
+            yield _parse_youtube_anchor(today, el.attrib)
+            _free(el)
+
+
 def parse_youtube_video_list(html_path: str) -> pd.DataFrame:
+    import pandas as pd
+
     today = date.today()
+    if etree is not None:
+        return pd.DataFrame.from_records(_stream_youtube_videos(today, html_path))
+
+    from bs4 import BeautifulSoup
+
     with open(html_path, encoding="utf-8") as fp:
         soup = BeautifulSoup(fp.read(), "html.parser")
 
     anchors = soup.findAll("a", id="video-title")
-    return pd.DataFrame([_parse_youtube_anchor(today, a) for a in anchors])
+    return pd.DataFrame([_parse_youtube_anchor(today, a.attrs) for a in anchors])
+
+
+def parse_saved_pages(
+    folder: str, parse: Callable[[str], pd.DataFrame], pattern: str = "*.html", workers: int = None
+) -> pd.DataFrame:
+    """Parse a folder of saved pages, a page per process
+
+    Args:
+        folder (str): folder of saved pages
+        parse (Callable[[str], pd.DataFrame]): page parser, e.g. parse_youtube_video_list
+        pattern (str, optional): file name pattern of the pages. Defaults to "*.html".
+        workers (int, optional): number of processes. Defaults to the number of CPUs.
+
+    Returns:
+        pd.DataFrame: the parsed tables of all pages, with the page's file name in a 'page' column
+    """
+    import pandas as pd
+
+    pages = sorted(Path(folder).glob(pattern))
+    if not pages:
+        return pd.DataFrame()
+    with ProcessPoolExecutor(workers) as executor:
+        tables = list(executor.map(parse, pages))
+    return pd.concat([t.assign(page=p.name) for p, t in zip(pages, tables)], ignore_index=True)
@@ -1,40 +1,70 @@
+import hashlib
+import json
+import logging
 import re
-from operator import itemgetter
+from collections import defaultdict, deque
 from pathlib import Path
+from itertools import chain
+from typing import Iterable, Iterator
 
-import toolz as tz
+from scholar_scripts.records import Clipping
+
+log = logging.getLogger(__name__)
 
 HLITE_PAGE_RGX = re.compile(r"Page: (\d+)")
 CLIPPINGS_PAGE_RGX = re.compile(r"page (\d+)")
+CLIPPINGS_LOCATION_RGX = re.compile(r"Location (\d+)")
+# clippings before the checkpoint offset that new ones are checked against, for the repeats and extended highlights
+# Kindle writes within a reading session
+CHECKPOINT_CLIPPINGS = 100
 
 
-def parse_highlight_file(filepath: Path) -> list[dict]:
-    notes, note = [], {}
+def iter_highlights(filepath: Path) -> Iterator[dict]:
+    """Stream the highlights of a read.amazon/notebook export, one at a time"""
+    note = None
     with filepath.open(mode="r", encoding="utf-8") as fp:
-        for line in fp.readlines():
+        for line in fp:
             if "highlight |" in line:
-                notes.append(note)
+                if note is not None:
+                    yield note
                 note = {}
                 if m := HLITE_PAGE_RGX.findall(line):
                     note["page"] = int(m[0])
+            elif note is None:
+                continue  # page contents copied before the first highlight
             elif "text" not in note:
                 note["text"] = line.strip()
             elif line and line.startswith("Note:"):
                 note["note"] = line[5:].strip()
+    if note is not None:
+        yield note
 
-    return notes[1:]
 
+def parse_highlight_file(filepath: Path) -> list[dict]:
+    return list(iter_highlights(filepath))
 
-# note is coming before the highlighted text
-def parse_myclippings_file(my_clippings_path: Path) -> dict[str, list[dict]]:
-    notes = []
-    with my_clippings_path.open(mode="r", encoding="utf-8") as fp:
+
+def iter_myclippings(my_clippings_path: Path, offset: int = 0) -> Iterator[tuple[dict, int]]:
+    """Stream the clippings of a Kindle 'My Clippings.txt' file. A note precedes the highlight it belongs to, so
+    both are yielded together as one clipping.
+
+    Args:
+        my_clippings_path (Path): path to the clippings file
+        offset (int, optional): byte offset to start reading from, see the offsets yielded. Defaults to 0.
+
+    Yields:
+        Iterator[tuple[dict, int]]: each clipping, and the byte offset just past it from which reading can resume
+    """
+    with my_clippings_path.open(mode="rb") as fp:
+        fp.seek(offset)
         blob, type_, bdepth = {}, None, 0
-        for raw_line in fp.readlines():
+        for raw in fp:
+            offset += len(raw)
+            raw_line = raw.decode("utf-8")
             if raw_line.startswith("=========="):
                 bdepth = 0
                 if type_ != "note":  # notes precede highlighted text and I want to group them
-                    notes.append(blob)
+                    yield blob, offset
                     blob = {}
             else:
                 if line := raw_line.strip():
@@ -45,10 +75,104 @@ def parse_myclippings_file(my_clippings_path: Path) -> dict[str, list[dict]]:
                         type_ = "highlight" if "Highlight" in raw_line else "note"
                         if pg := CLIPPINGS_PAGE_RGX.findall(line):
                             blob["page"] = int(pg[0])
+                        if loc := CLIPPINGS_LOCATION_RGX.findall(line):
+                            blob["location"] = int(loc[0])
                     else:
                         blob["note" if type_ == "note" else "text"] = line
 
-    return tz.groupby(itemgetter("title"), notes)
+
+def clipping_key(clipping: dict) -> str:
+    raw = "\x1f".join(str(clipping.get(k, "")) for k in ("title", "location", "text", "note"))
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def group_clippings(clippings: Iterable[dict | Clipping]) -> dict[str, list[dict | Clipping]]:
+    """Group clippings by title in one pass, dropping the duplicates Kindle exports
+
+    Args:
+        clippings (Iterable[dict | Clipping]): clippings, in file order
+
+    Returns:
+        dict[str, list[dict]]: clippings by title. Exact repeats are dropped. When a highlight was extended (a later
+        clipping at the same location containing the earlier text), only the extended one is kept.
+    """
+    seen, grouped, at_location = set(), defaultdict(list), {}
+    for clipping in clippings:
+        key = clipping_key(clipping)
+        if key in seen:
+            continue
+        seen.add(key)
+        notes = grouped[clipping.get("title")]
+        loc = (clipping.get("title"), clipping.get("location"))
+        if loc[1] is not None and (i := at_location.get(loc)) is not None:
+            if (earlier := notes[i].get("text")) and clipping.get("text", "").startswith(earlier):
+                # keeps a note made on the shorter highlight
+                notes[i] = {**notes[i], **clipping} if isinstance(clipping, dict) else notes[i].merged(clipping)
+                continue
+        at_location[loc] = len(notes)
+        notes.append(clipping)
+    return dict(grouped)
+
+
+# note is coming before the highlighted text
+def parse_myclippings_file(my_clippings_path: Path) -> dict[str, list[dict]]:
+    return group_clippings(clipping for clipping, _ in iter_myclippings(my_clippings_path))
+
+
+def parse_myclippings_records(my_clippings_path: Path) -> dict[str, list[Clipping]]:
+    """parse_myclippings_file with a Clipping per clipping instead of a dict, for files of tens of thousands of
+    clippings. Clipping.to_frame(clippings) makes a DataFrame of them, clipping.as_dict() the dict.
+    """
+    return group_clippings(Clipping.from_dict(clipping) for clipping, _ in iter_myclippings(my_clippings_path))
+
+
+def _tail_digest(path: Path, offset: int) -> str:
+    # fingerprint of the bytes before a checkpoint, to notice a clippings file that was replaced or rewritten
+    with path.open(mode="rb") as fp:
+        fp.seek(max(0, offset - 4096))
+        return hashlib.sha1(fp.read(offset - max(0, offset - 4096))).hexdigest()
+
+
+def parse_new_clippings(my_clippings_path: Path, checkpoint_path: Path) -> dict[str, list[dict]]:
+    """Parse only the clippings appended to the file since the last call with the same checkpoint
+
+    Args:
+        my_clippings_path (Path): path to the clippings file
+        checkpoint_path (Path): json file recording how far the file has been parsed, and the last
+            CHECKPOINT_CLIPPINGS clippings before that point
+
+    Returns:
+        dict[str, list[dict]]: the new clippings by title, grouped as by group_clippings along with the clippings
+        kept in the checkpoint: a repeat of one of those is dropped, and a highlight extending one is returned with
+        its note. Repeats of older clippings are returned again. The whole file is parsed again when it no longer
+        matches the checkpoint.
+    """
+    checkpoint = json.loads(checkpoint_path.read_text(encoding="utf-8")) if checkpoint_path.exists() else {}
+    offset, recent = checkpoint.get("offset", 0), checkpoint.get("recent", [])
+    if offset and (
+        my_clippings_path.stat().st_size < offset or _tail_digest(my_clippings_path, offset) != checkpoint.get("tail")
+    ):
+        log.info(f"{my_clippings_path} changed since the last checkpoint, parsing all of it")
+        offset, recent = 0, []
+
+    last = deque(recent, maxlen=CHECKPOINT_CLIPPINGS)
+
+    def _track(clippings):
+        nonlocal offset
+        for clipping, offset in clippings:
+            last.append(clipping)
+            yield clipping
+
+    # the checkpoint's clippings are grouped again with the new ones, and left out of what is returned unless a new
+    # highlight extended them
+    before = group_clippings(recent)
+    after = group_clippings(chain(recent, _track(iter_myclippings(my_clippings_path, offset))))
+    grouped = {t: new for t, notes in after.items() if (new := [n for n in notes if n not in before.get(t, [])])}
+    checkpoint_path.write_text(
+        json.dumps({"offset": offset, "tail": _tail_digest(my_clippings_path, offset), "recent": list(last)}),
+        encoding="utf-8",
+    )
+    return grouped
 
 
 def write_to_file(output: Path, notes: list[dict]) -> None:
@@ -60,9 +184,7 @@ def write_to_file(output: Path, notes: list[dict]) -> None:
 
     If a 'note' exists for a text item, the text is printed with a 'note:' line below
     """
-    s = ""
-    for n in notes:
-        nt = f"\nnote: {n['note']}" if n.get("note") else ""
-        s += f"{n['text']}  {nt}  \n\n"
-
-    output.write_text(s, encoding="utf-8")
+    with output.open(mode="w", encoding="utf-8") as fp:
+        for n in notes:
+            nt = f"\nnote: {n['note']}" if n.get("note") else ""
+            fp.write(f"{n['text']}  {nt}  \n\n")
@@ -1,16 +1,32 @@
+from __future__ import annotations
+
+import asyncio
 import concurrent.futures
+import contextlib
 import json
 import logging
+import os
+import queue
+import random
 import re
+import threading
 import time
 from datetime import datetime
 from enum import StrEnum
+from pathlib import Path
+from typing import TYPE_CHECKING, AsyncIterator, Iterator
 
-import requests
 import toolz as tz
-from bs4 import BeautifulSoup
 
+import scholar_scripts.timing as tm
 import scholar_scripts.utils as u
+from scholar_scripts.records import MediaAvailability
+from scholar_scripts.result_cache import ResultCache
+
+if TYPE_CHECKING:
+    import requests
+
+# pandas, requests and BeautifulSoup are imported where they are used, so importing this module stays fast
 
 log = logging.getLogger(__name__)
 
@@ -39,6 +55,13 @@ OVERDRIVE_TITLE_KEYS = {
 
 DATE_FMT = "%Y-%m-%d"
 
+OVERDRIVE_SEARCH_URL = "https://{library}.overdrive.com/search/title?query={title}&creator={author}"
+MEDIA_ITEMS_MARKER = b"window.OverDrive.mediaItems"
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+PROFILE_ENV = "SCHOLAR_PROFILE"  # "cprofile" or "pyinstrument", profiles every search
+AVAILABILITY_COLUMNS = ["ebook_owned", "ebook_available", "audiobook_owned", "audiobook_available"]
+
 
 class Query(StrEnum):
     PREV_UNAVAIL = (
@@ -70,21 +93,54 @@ def _parse_media_item(raw_items: list[dict]) -> dict:
     return rval
 
 
-def search_for_media(author: str, title: str, library: LibraryCode) -> dict:
+def _media_items_from_soup(text: str) -> dict:
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(text, "html.parser")
+    if t := soup.find("script"):
+        if m := re.search(r"\n\s*window.OverDrive.mediaItems(.+)\n", t.string):
+            if raw := m.group():
+                return json.loads(raw[raw.find("{") : raw.rfind("}") + 1])
+
+
+def _extract_media_items(content: bytes) -> dict:
+    # scan the raw bytes for the mediaItems assignment and only decode its json, rather than parsing the whole page
+    start = content.find(MEDIA_ITEMS_MARKER)
+    if start < 0:
+        return None
+    end = content.find(b"\n", start)
+    line = content[start : end if end >= 0 else len(content)]
+    try:
+        return json.loads(line[line.find(b"{") : line.rfind(b"}") + 1])
+    except ValueError:
+        log.debug("Unexpected mediaItems payload, falling back to parsing the page")
+        return _media_items_from_soup(content.decode("utf-8", errors="replace"))
+
+
+def search_for_media(author: str, title: str, library: LibraryCode, session: requests.Session = None) -> dict:
     """search a library for a media item by title and author
 
     Args:
         author (str): author
         title (str): title
         library (LibraryCode): library to search
+        session (requests.Session, optional): session to reuse connections from. Defaults to a one-off request.
 
     Returns:
         dict: search results and query meta data
     """
-    _url = f"https://{library}.overdrive.com/search/title?query={title}&creator={author}"
+    _url = OVERDRIVE_SEARCH_URL.format(library=library, title=title, author=author)
     t0 = time.time()
     log.debug(f"Making HTTP request {_url}")
-    response = requests.get(_url)
+    if session is None:
+        import requests
+
+        session = requests  # requests.get, a one-off request
+
+    with tm.span("http"):
+        response = session.get(_url)
+    tm.count("http_requests")
+    tm.count("bytes_received", len(response.content))
     _meta = {
         "query_status_code": response.status_code,
         "query_time": time.time() - t0,
@@ -94,53 +150,447 @@ def search_for_media(author: str, title: str, library: LibraryCode) -> dict:
         "query_author": author,
         "requested_on": u.now_iso(),
     }
-    soup = BeautifulSoup(response.text, "html.parser")
-    if t := soup.find("script"):
-        if m := re.search(r"\n\s*window.OverDrive.mediaItems(.+)\n", t.string):
-            if raw := m.group():
-                if _items := json.loads(raw[raw.find("{") : raw.rfind("}") + 1]):
-                    rval = _parse_media_item(list(_items.values()))
-                    return {**rval, **_meta}
+    with tm.span("extract"):
+        if _items := _extract_media_items(response.content):
+            return {**_parse_media_item(list(_items.values())), **_meta}
     return _meta
 
 
-def search_library(library: LibraryCode, book_list: list[dict], delay: float = 1.0) -> list[dict]:
-    """Search a particular library for book availabilities
+class TokenBucket:
+    """Rate limiter allowing `rate` requests per second on average, in bursts of up to `capacity`. A rate of None
+    doesn't limit requests.
+    """
+
+    def __init__(self, rate: float | None, capacity: float = 1):
+        self.rate, self.capacity = rate, capacity
+        self.tokens, self.updated_at = capacity, time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        if self.rate is None:
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def _rate(delay: float) -> float | None:
+    # the request rate of an average delay between requests, no delay meaning no limit
+    return 1 / delay if delay > 0 else None
+
+
+def _session(pool_size: int) -> requests.Session:
+    # keep-alive connections to the library's host, one per concurrent request
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+    return session
+
+
+def _query_terms(book: dict) -> tuple[str, str]:
+    _author = book.get("query_author") or u.clean_author(book["Author"])
+    _title = book.get("query_title") or u.clean_title(book["Title"])
+    return _author, _title
+
+
+async def _search_book(
+    author: str,
+    title: str,
+    library: LibraryCode,
+    session: requests.Session,
+    bucket: TokenBucket,
+    slots: asyncio.Semaphore,
+    retries: int,
+) -> dict:
+    import requests
+
+    for attempt in range(retries + 1):
+        with tm.span("rate_limit_wait"):
+            await bucket.acquire()
+        try:
+            async with slots:
+                result = await asyncio.to_thread(search_for_media, author, title, library, session)
+            if result["query_status_code"] not in RETRY_STATUS_CODES or attempt == retries:
+                return result
+            log.debug(f"Status {result['query_status_code']} searching {library.name} for {title}, retrying")
+        except requests.RequestException as ex:  # connection errors and timeouts, which may not happen again
+            if attempt == retries:
+                log.warning(f"Exception raised processing {title} :\n{ex}")
+                tm.count("http_failures")
+                return None
+        except Exception as ex:  # e.g. a page that doesn't parse, which would fail the same way when retried
+            log.warning(f"Exception raised processing {title} :\n{ex}")
+            tm.count("http_failures")
+            return None
+        tm.count("http_retries")
+        await asyncio.sleep(2**attempt + random.random())  # exponential backoff with jitter
+
+
+async def _search_books(
+    library: LibraryCode, queries: list[tuple[str, str]], rate: float, concurrency: int, retries: int
+) -> list[dict]:
+    bucket, slots = TokenBucket(rate), asyncio.Semaphore(concurrency)
+    with _session(concurrency) as session:
+        return await asyncio.gather(*[_search_book(*q, library, session, bucket, slots, retries) for q in queries])
+
+
+def _requery_keys(entries: dict[tuple, tuple[dict, float]], requery: Query) -> set[tuple]:
+    import pandas as pd
+
+    keys = list(entries)
+    df = pd.DataFrame([entries[k][0] for k in keys])
+    for col in AVAILABILITY_COLUMNS:
+        if col not in df:
+            df[col] = float("nan")
+    return {keys[i] for i in df.query(requery).index}
+
+
+def _revalidate_in_background(library: LibraryCode, keys: list[tuple], cache: ResultCache, *args):
+    async def _refresh():
+        fetched = await _search_books(library, [k[1:] for k in keys], *args)
+        cache.put_many(list(zip(keys, fetched)))
+        log.info(f"Refreshed {len(keys)} stale {library.name} results in the background")
+
+    threading.Thread(target=asyncio.run, args=(_refresh(),), daemon=True).start()
+
+
+async def search_library_async(
+    library: LibraryCode,
+    book_list: list[dict],
+    rate: float = 1.0,
+    concurrency: int = 4,
+    retries: int = 3,
+    cache: ResultCache = None,
+    requery: Query = None,
+    revalidate: bool = False,
+) -> list[dict]:
+    """Search a particular library for book availabilities, with pooled connections and a request rate limit
 
     Args:
         library (LibraryCode): library to search
         book_list (list[dict]): list of books to search for (by Title and Author)
-        delay (float, optional): Seconds delay between Overdrive HHTP requests. Defaults to 1.0.
+        rate (float, optional): average Overdrive HTTP requests per second, None for no limit. Defaults to 1.0.
+        concurrency (int, optional): maximum number of requests in flight. Defaults to 4.
+        retries (int, optional): retries, with backoff, of requests that fail to connect, time out or get a
+            429/5xx. Defaults to 3.
+        cache (ResultCache, optional): reuse results that are younger than the cache's TTLs. Defaults to None.
+        requery (Query, optional): with a cache, only search again for cached results matching this query (e.g.
+            Query.PREV_UNAVAIL) and reuse the others regardless of age. Defaults to None.
+        revalidate (bool, optional): with a cache, return stale results right away and refresh them in the
+            background for the next run. Defaults to False.
+
+    Returns:
+        list[dict]: search results for each book, in book_list order
+    """
+    queries = [_query_terms(b) for b in book_list]
+    if cache is None:
+        return [r for r in await _search_books(library, queries, rate, concurrency, retries) if r is not None]
+
+    keys = [(library.value, *q) for q in queries]
+    entries = cache.get_many(keys)
+    forced = _requery_keys(entries, requery) if requery and entries else set()
+    results, fetch, refresh = {}, [], []
+    for key in dict.fromkeys(keys):
+        entry = entries.get(key)
+        if entry is None or key in forced:
+            fetch.append(key)
+        elif requery or cache.is_fresh(*entry):
+            results[key] = entry[0]
+        elif revalidate:
+            results[key] = entry[0]
+            refresh.append(key)
+        else:
+            fetch.append(key)
+    log.info(f"{library.name}: {len(results)} cached results, searching for {len(fetch)}")
+    tm.count("cache_hits", len(results) - len(refresh))
+    tm.count("cache_stale", len(refresh))
+    tm.count("cache_misses", len(fetch))
+
+    fetched = await _search_books(library, [k[1:] for k in fetch], rate, concurrency, retries)
+    cache.put_many(list(zip(fetch, fetched)))
+    results.update(zip(fetch, fetched))
+    if refresh:
+        _revalidate_in_background(library, refresh, cache, rate, concurrency, retries)
+    return [results[k] for k in keys if results.get(k) is not None]
+
+
+async def search_libraries_async(
+    book_list: list[dict],
+    rate: float = 1.0,
+    libraries: list[LibraryCode] = None,
+    concurrency: int = 4,
+    retries: int = 3,
+    cache: ResultCache = None,
+    requery: Query = None,
+    revalidate: bool = False,
+) -> list[dict]:
+    """Search libraries concurrently for digital book availability, each library with its own rate limit
+
+    Args:
+        book_list (list[dict]): list of books to locate (by Title and Author)
+        rate (float, optional): average Overdrive HTTP requests per second, per library, None for no limit.
+            Defaults to 1.0.
+        libraries (list[LibraryCode]): List of libraries to search. Defaults to search all
+        concurrency (int, optional): maximum number of requests in flight per library. Defaults to 4.
+        retries (int, optional): retries, with backoff, of requests that fail to connect, time out or get a
+            429/5xx. Defaults to 3.
+        cache (ResultCache, optional): see search_library_async. Defaults to None.
+        requery (Query, optional): see search_library_async. Defaults to None.
+        revalidate (bool, optional): see search_library_async. Defaults to False.
 
     Returns:
         list[dict]: search results for each book
     """
-    results = []
-    for book in book_list:
-        _author = book.get("query_author") or u.clean_author(book["Author"])
-        _title = book.get("query_title") or u.clean_title(book["Title"])
+    libs_to_search = libraries if libraries else LibraryCode
+    results = await asyncio.gather(
+        *[
+            search_library_async(lib, book_list, rate, concurrency, retries, cache, requery, revalidate)
+            for lib in libs_to_search
+        ]
+    )
+    return [x for xs in results for x in xs]  # flatten
+
+
+async def iter_search_results_async(
+    searches: list[tuple[LibraryCode, str, str]], rate: float = 1.0, concurrency: int = 4, retries: int = 3
+) -> AsyncIterator[dict]:
+    """Search for (library, author, title) triples, yielding each result as soon as it arrives
+
+    Args:
+        searches (list[tuple[LibraryCode, str, str]]): library and cleaned author and title of each search
+        rate (float, optional): average Overdrive HTTP requests per second, per library, None for no limit.
+            Defaults to 1.0.
+        concurrency (int, optional): maximum number of requests in flight per library. Defaults to 4.
+        retries (int, optional): retries, with backoff, of requests that fail to connect, time out or get a
+            429/5xx. Defaults to 3.
+
+    Yields:
+        dict: search results in the order they complete, without those whose request kept raising
+    """
+    libraries = {library for library, *_ in searches}
+    limits = {library: (TokenBucket(rate), asyncio.Semaphore(concurrency)) for library in libraries}
+    with contextlib.ExitStack() as stack:
+        sessions = {library: stack.enter_context(_session(concurrency)) for library in libraries}
+        tasks = [
+            asyncio.create_task(_search_book(a, t, library, sessions[library], *limits[library], retries))
+            for library, a, t in searches
+        ]
+        try:
+            for next_result in asyncio.as_completed(tasks):
+                if (result := await next_result) is not None:
+                    yield result
+        finally:  # the consumer stopped early, or was cancelled
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def _run(name: str, coro, profile: str = None):
+    # notebooks already run an event loop, so the search gets its own loop on another thread. The timed run (and
+    # any profile) is of that thread, HTTP requests and page extraction run on worker threads and show as spans.
+    def _timed():
+        with tm.run(name, profile, PROFILE_ENV):
+            return asyncio.run(coro)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(_timed).result()
+
+
+_END = object()
+
+
+def _stream(name: str, results: AsyncIterator, profile: str = None) -> Iterator:
+    # like _run, on an event loop of its own thread, handing each item over as soon as it's yielded. Closing the
+    # generator (e.g. breaking out of a for loop, or a KeyboardInterrupt) cancels the search.
+    items, loop = queue.Queue(), asyncio.new_event_loop()
+
+    async def _pump():
         try:
-            _result = search_for_media(_author, _title, library)
-            results.append(_result)
+            async for item in results:
+                items.put(item)
         except Exception as ex:
-            log.warn(f"Exception raised processing {_title} :\n{ex}")
-        time.sleep(delay)
-    return results
+            items.put(ex)
+        finally:
+            items.put(_END)
+
+    pump = loop.create_task(_pump())
+
+    def _timed():
+        with tm.run(name, profile, PROFILE_ENV), contextlib.suppress(asyncio.CancelledError):
+            loop.run_until_complete(pump)
 
+    thread = threading.Thread(target=_timed, daemon=True)
+    thread.start()
+    try:
+        while (item := items.get()) is not _END:
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        if thread.is_alive():
+            loop.call_soon_threadsafe(pump.cancel)
+        thread.join()
+        loop.close()
 
-def search_libraries(book_list: list[dict], delay: float = 1, libraries: list[LibraryCode] = None) -> list[dict]:
-    """Search libraries in parallel for digital book availability
+
+def search_library(
+    library: LibraryCode,
+    book_list: list[dict],
+    delay: float = 1.0,
+    concurrency: int = 4,
+    profile: str = None,
+    **cache_options,
+) -> list[dict]:
+    """Search a particular library for book availabilities, logging where the time went at the end
+
+    Args:
+        library (LibraryCode): library to search
+        book_list (list[dict]): list of books to search for (by Title and Author)
+        delay (float, optional): Average seconds between Overdrive HTTP requests, 0 for no limit. Defaults to 1.0.
+        concurrency (int, optional): maximum number of requests in flight. Defaults to 4.
+        profile (str, optional): also profile the search, see timing.run. Defaults to None.
+        cache_options: cache, requery and revalidate, see search_library_async
+
+    Returns:
+        list[dict]: search results for each book
+    """
+    return _run(
+        f"search_library {library.name}",
+        search_library_async(library, book_list, rate=_rate(delay), concurrency=concurrency, **cache_options),
+        profile,
+    )
+
+
+def search_libraries(
+    book_list: list[dict],
+    delay: float = 1,
+    libraries: list[LibraryCode] = None,
+    concurrency: int = 4,
+    profile: str = None,
+    **cache_options,
+) -> list[dict]:
+    """Search libraries in parallel for digital book availability, logging where the time went at the end
 
     Args:
         book_list (list[dict]): list of books to locate (by Title and Author)
-        delay (float, optional): Seconds delay between Overdrive HHTP requests. Defaults to 1.
+        delay (float, optional): Average seconds between Overdrive HTTP requests, per library, 0 for no limit.
+            Defaults to 1.
         libraries (list[LibraryCode]): List of libraries to search. Defaults to search all
+        concurrency (int, optional): maximum number of requests in flight per library. Defaults to 4.
+        profile (str, optional): also profile the search, see timing.run. Defaults to None.
+        cache_options: cache, requery and revalidate, see search_library_async
 
     Returns:
         list[dict]: search results for each book
     """
-    libs_to_search = libraries if libraries else LibraryCode
-    with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
-        futures = [executor.submit(search_library, lib, book_list, delay) for lib in libs_to_search]
-        results = [future.result() for future in concurrent.futures.as_completed(futures)]
-        return [x for xs in results for x in xs]  # flatten
+    return _run(
+        "search_libraries",
+        search_libraries_async(
+            book_list, rate=_rate(delay), libraries=libraries, concurrency=concurrency, **cache_options
+        ),
+        profile,
+    )
+
+
+class SearchJob:
+    """A search of libraries for a book list that survives being interrupted. Each result is appended to a JSON
+    lines file as soon as it arrives, and a job run again with the same file only searches for the (library, author,
+    title) triples that aren't in it yet, e.g. after a crash, a Ctrl-C or a kernel restart.
+    """
+
+    def __init__(self, path: str, book_list: list[dict], libraries: list[LibraryCode] = None):
+        self.path = Path(path)
+        queries = dict.fromkeys(_query_terms(b) for b in book_list)
+        self.searches = [(library, *q) for library in libraries or LibraryCode for q in queries]
+
+    @staticmethod
+    def _key(library: LibraryCode, author: str, title: str) -> tuple[str, str, str]:
+        return str(library.name).lower(), author, title
+
+    def _saved(self) -> Iterator[dict]:
+        if not self.path.exists():
+            return
+        with open(self.path, encoding="utf-8") as fp:
+            for n, line in enumerate(fp, start=1):
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    log.warning(f"Skipping unreadable line {n} of {self.path}")
+
+    def results(self) -> list[dict]:
+        """The results saved so far, skipping a line cut short by an interruption"""
+        return list(self._saved())
+
+    def records(self) -> list[MediaAvailability]:
+        """The results saved so far as MediaAvailability records, which take a third of the memory of results'
+        dicts. Media types other than ebooks and audiobooks, e.g. magazines, are kept in each record's extra dict.
+        MediaAvailability.to_frame(job.records()) makes the DataFrame of pd.DataFrame(job.results()), with a column
+        for every field.
+        """
+        return [MediaAvailability.from_dict(r) for r in self._saved()]
+
+    def pending(self) -> list[tuple[LibraryCode, str, str]]:
+        """The searches without a saved result"""
+        done = {(r["library"], r["query_author"], r["query_title"]) for r in self._saved()}
+        return [s for s in self.searches if self._key(*s) not in done]
+
+    async def stream_async(self, rate: float = 1.0, concurrency: int = 4, retries: int = 3) -> AsyncIterator[dict]:
+        """Search for the pending books, saving and yielding each result as it arrives
+
+        Args:
+            rate (float, optional): average Overdrive HTTP requests per second, per library, None for no limit.
+                Defaults to 1.0.
+            concurrency (int, optional): maximum number of requests in flight per library. Defaults to 4.
+            retries (int, optional): retries, with backoff, of requests that fail to connect, time out or get a
+                429/5xx. Defaults to 3.
+
+        Yields:
+            dict: new search results, in the order they complete. Failed searches are yielded but not saved, so the
+            next run tries them again.
+        """
+        pending = self.pending()
+        log.info(f"{len(self.searches) - len(pending)} of {len(self.searches)} searches done, {len(pending)} left")
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "ab+") as fp:
+            if fp.tell():
+                fp.seek(-1, os.SEEK_END)
+                if fp.read(1) != b"\n":
+                    fp.write(b"\n")  # after a line cut short, which results() skips
+            async for result in iter_search_results_async(pending, rate, concurrency, retries):
+                if result["query_status_code"] == 200:
+                    fp.write(json.dumps(result).encode("utf-8") + b"\n")
+                    fp.flush()
+                yield result
+
+    def stream(self, delay: float = 1.0, concurrency: int = 4, profile: str = None) -> Iterator[dict]:
+        """Search for the pending books, saving and yielding each result as it arrives, from any library. Stopping
+        early, by breaking out of the loop or interrupting it, cancels the search and keeps the results saved so far.
+
+        Args:
+            delay (float, optional): Average seconds between Overdrive HTTP requests, per library, 0 for no limit.
+                Defaults to 1.0.
+            concurrency (int, optional): maximum number of requests in flight per library. Defaults to 4.
+            profile (str, optional): also profile the search, see timing.run. Defaults to None.
+
+        Yields:
+            dict: new search results, see stream_async
+        """
+        yield from _stream("search_job", self.stream_async(rate=_rate(delay), concurrency=concurrency), profile)
+
+    def run(self, delay: float = 1.0, concurrency: int = 4, profile: str = None) -> list[dict]:
+        """Search for the pending books, see stream
+
+        Returns:
+            list[dict]: all saved results, of this and earlier runs
+        """
+        for _ in self.stream(delay, concurrency, profile):
+            pass
+        return self.results()
@@ -0,0 +1,131 @@
+"""Slotted records for the rows the parsers produce by the ten thousand, Kindle clippings and Overdrive search results
+
+A record has no per instance __dict__, and its field names are stored once on the class instead of as keys in every
+row: a search result read from json takes 40-50% of its dict's memory as a record, and a clipping 80-90%, since its
+text takes most of it (see benchmarks/records.py). Records read like the dicts they replace (record.get('text'),
+record['text'], {**record}), turn back into dicts with as_dict, which has a key for every field, and into a DataFrame,
+column by column, with to_frame.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass, fields
+from functools import cache
+from typing import TYPE_CHECKING, Iterable
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+@cache
+def _field_names(cls: type) -> tuple[str, ...]:
+    # the fields holding a key of the parsers' dicts, all but extra
+    return tuple(f.name for f in fields(cls) if f.name != "extra")
+
+
+@cache
+def _field_set(cls: type) -> frozenset[str]:
+    return frozenset(_field_names(cls))
+
+
+class _Record:
+    __slots__ = ()
+
+    def get(self, key: str, default=None):
+        # a field that is None reads as missing, as the key is in the dicts these records replace
+        value = getattr(self, key, None) if key != "extra" else None
+        if value is None and self.extra:
+            value = self.extra.get(key)
+        return default if value is None else value
+
+    def __getitem__(self, key: str):
+        if (value := self.get(key)) is None:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key) is not None
+
+    def keys(self) -> list[str]:
+        # with __getitem__, lets {**record} and dict(record) work as with the dicts
+        return [k for k in _field_names(type(self)) if getattr(self, k) is not None] + list(self.extra or ())
+
+    def as_dict(self) -> dict:
+        """The dict of this row, with a key for every field, None included (a search result's missing subtitle, a
+        clipping without a note), then the keys of extra. Unlike {**record}, which leaves out the fields that are None.
+        """
+        d = {k: getattr(self, k) for k in _field_names(type(self))}
+        return {**d, **self.extra} if self.extra else d
+
+    def merged(self, other: _Record | dict):
+        """A copy with the fields of other that aren't None"""
+        # {**record} already leaves them out
+        values = {k: v for k, v in other.items() if v is not None} if isinstance(other, dict) else {**other}
+        return type(self).from_dict({**self.as_dict(), **values})
+
+    @classmethod
+    def from_dict(cls, d: dict):
+        """The record of a parser's dict. Keys that aren't fields, e.g. the availability of a media type besides
+        ebooks and audiobooks, are kept in the record's extra dict.
+        """
+        # positional, as keys read from json aren't interned and slow down matching keyword arguments
+        record, names = cls(*map(d.get, _field_names(cls))), _field_set(cls)
+        if not d.keys() <= names:
+            record.extra = {k: v for k, v in d.items() if k not in names}
+        return record
+
+    @classmethod
+    def to_frame(cls, records: Iterable[_Record]) -> pd.DataFrame:
+        """A DataFrame with a column per field, then one per key of the records' extra dicts, built from lists of
+        values rather than a dict per row
+        """
+        import pandas as pd
+
+        names = _field_names(cls)
+        columns, extra, n = {k: [] for k in names}, {}, 0
+        for n, r in enumerate(records, start=1):
+            for k in names:
+                columns[k].append(getattr(r, k))
+            if r.extra:
+                for k, v in r.extra.items():
+                    extra.setdefault(k, {})[n - 1] = v
+        columns.update((k, [values.get(i) for i in range(n)]) for k, values in extra.items())
+        return pd.DataFrame(columns, columns=list(columns))
+
+
+@dataclass(slots=True)
+class Clipping(_Record):
+    """A Kindle highlight, with the note made on it"""
+
+    title: str = None
+    page: int = None
+    location: int = None
+    text: str = None
+    note: str = None
+    extra: dict = None
+
+
+@dataclass(slots=True)
+class MediaAvailability(_Record):
+    """An Overdrive search result: the title found, its ebook and audiobook availability, and the query made"""
+
+    title: str = None
+    subtitle: str = None
+    publish_date: str = None
+    author: str = None
+    ebook_available: int = None
+    ebook_owned: int = None
+    ebook_held: int = None
+    ebook_estimated_wait: int = None
+    audiobook_available: int = None
+    audiobook_owned: int = None
+    audiobook_held: int = None
+    audiobook_estimated_wait: int = None
+    query_status_code: int = None
+    query_time: float = None
+    library: str = None
+    query_url: str = None
+    query_title: str = None
+    query_author: str = None
+    requested_on: str = None
+    extra: dict = None  # keys without a field, e.g. magazine_available
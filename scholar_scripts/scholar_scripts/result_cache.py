@@ -0,0 +1,84 @@
+import json
+import logging
+import sqlite3
+import time
+from contextlib import closing
+from datetime import timedelta
+
+import scholar_scripts.timing as tm
+
+log = logging.getLogger(__name__)
+
+DEFAULT_CACHE_PATH = "data/generated/overdrive_cache.sqlite"
+
+# how long a result is trusted, by what it found: missing titles rarely appear, availability changes daily
+DEFAULT_TTLS = {
+    "not_found": timedelta(days=14),
+    "unavailable": timedelta(days=1),
+    "available": timedelta(days=1),
+}
+
+
+def result_kind(result: dict) -> str:
+    if "title" not in result:
+        return "not_found"
+    if result.get("ebook_available", 0) >= 1 or result.get("audiobook_available", 0) >= 1:
+        return "available"
+    return "unavailable"
+
+
+class ResultCache:
+    """Overdrive search results on disk, keyed by library, cleaned author and cleaned title. Holds at most
+    `max_entries` results, evicting the least recently used.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, ttls: dict[str, timedelta] = None, max_entries: int = 50_000):
+        self.path = path
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        self.max_entries = max_entries
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS results (
+                    library TEXT, author TEXT, title TEXT, result TEXT NOT NULL, fetched_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL, PRIMARY KEY (library, author, title))"""
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS results_accessed_at ON results (accessed_at)")
+
+    def _connect(self) -> sqlite3.Connection:
+        # a connection per call, so the cache can be used from background refresh threads
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get_many(self, keys: list[tuple[str, str, str]]) -> dict[tuple, tuple[dict, float]]:
+        """Look up results by (library, author, title)
+
+        Returns:
+            dict[tuple, tuple[dict, float]]: the cached result and its age in seconds, for the keys in the cache
+        """
+        now, found = time.time(), {}
+        with tm.span("cache_get"), closing(self._connect()) as conn, conn:
+            for key in keys:
+                row = conn.execute(
+                    "SELECT result, fetched_at FROM results WHERE library = ? AND author = ? AND title = ?", key
+                ).fetchone()
+                if row:
+                    found[key] = (json.loads(row[0]), now - row[1])
+            conn.executemany(
+                "UPDATE results SET accessed_at = ? WHERE library = ? AND author = ? AND title = ?",
+                [(now, *key) for key in found],
+            )
+        return found
+
+    def put_many(self, items: list[tuple[tuple[str, str, str], dict]]):
+        """Store (key, result) pairs, skipping failed requests, then evict down to max_entries"""
+        now = time.time()
+        rows = [(*key, json.dumps(r), now, now) for key, r in items if r and r.get("query_status_code") == 200]
+        with tm.span("cache_put"), closing(self._connect()) as conn, conn:
+            conn.executemany("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?)", rows)
+            conn.execute(
+                """DELETE FROM results WHERE rowid IN
+                    (SELECT rowid FROM results ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)""",
+                (self.max_entries,),
+            )
+
+    def is_fresh(self, result: dict, age: float) -> bool:
+        return age < self.ttls[result_kind(result)].total_seconds()
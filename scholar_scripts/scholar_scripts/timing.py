@@ -0,0 +1,124 @@
+"""Stage timings, counters and profiling of a run
+
+recipe_room and scholar_scripts keep identical copies of this module, change both.
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+log = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_spans = defaultdict(lambda: [0, 0.0])  # stage -> [calls, seconds]
+_counters = defaultdict(int)
+
+
+@contextmanager
+def span(stage: str):
+    """Add the time spent in the block to a stage of the current run"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        with _lock:
+            _spans[stage][0] += 1
+            _spans[stage][1] += elapsed
+
+
+def count(name: str, n: int = 1):
+    with _lock:
+        _counters[name] += n
+
+
+def drain() -> dict:
+    """Take the stage timings and counters recorded so far, e.g. to return them from a worker process
+
+    Returns:
+        dict: 'spans' of stage -> [calls, seconds] and 'counters' of name -> count
+    """
+    with _lock:
+        data = {"spans": {k: list(v) for k, v in _spans.items()}, "counters": dict(_counters)}
+        _spans.clear()
+        _counters.clear()
+    return data
+
+
+def merge(data: dict):
+    """Add timings and counters taken with drain, e.g. in a worker process, to the current run"""
+    with _lock:
+        for stage, (calls, seconds) in data["spans"].items():
+            _spans[stage][0] += calls
+            _spans[stage][1] += seconds
+        for name, n in data["counters"].items():
+            _counters[name] += n
+
+
+def summary(name: str, elapsed: float, data: dict) -> str:
+    # shares are of the run's wall time, so stages running on several threads or processes can add up to over 100%
+    lines = [f"{name} took {elapsed:.3f} s", f"  {'stage':24}{'calls':>8}{'seconds':>10}{'share':>8}"]
+    for stage, (calls, seconds) in sorted(data["spans"].items(), key=lambda kv: -kv[1][1]):
+        lines.append(f"  {stage:24}{calls:8d}{seconds:10.3f}{seconds / elapsed:8.1%}")
+    if data["counters"]:
+        lines.append("  " + "  ".join(f"{k}={v:,}" for k, v in sorted(data["counters"].items())))
+    return "\n".join(lines)
+
+
+@contextmanager
+def _profiler(kind: str):
+    if kind == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            log.warning("pyinstrument is not installed, profiling with cProfile instead")
+            kind = "cprofile"
+        else:
+            profiler = Profiler()
+            profiler.start()
+            try:
+                yield
+            finally:
+                profiler.stop()
+                log.info(profiler.output_text(unicode=True))
+            return
+    import cProfile
+    import io
+    import pstats
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(30)
+        log.info(out.getvalue())
+
+
+@contextmanager
+def run(name: str, profile: str = None, profile_env: str = None):
+    """Time a whole run, logging the time spent in each stage and the counters at the end
+
+    Args:
+        name (str): name of the run in the summary
+        profile (str, optional): also profile the run, with "cprofile" or "pyinstrument" (which falls back to
+            cProfile when not installed). Defaults to the profile_env environment variable, unset means no profile.
+        profile_env (str, optional): environment variable that profiles every run when set to "cprofile" or
+            "pyinstrument", e.g. RECIPES_PROFILE. Defaults to None.
+    """
+    profile = profile or (os.environ.get(profile_env) if profile_env else None)
+    drain()
+    start = time.perf_counter()
+    try:
+        if profile:
+            with _profiler(profile.lower()):
+                yield
+        else:
+            yield
+    finally:
+        log.info(summary(name, time.perf_counter() - start, drain()))
@@ -1,10 +1,16 @@
+from __future__ import annotations
+
+import locale
 import logging
 import os
+import string
 from datetime import datetime
 from importlib import reload
 from logging.config import dictConfig
+from typing import TYPE_CHECKING
 
-import pandas as pd
+if TYPE_CHECKING:  # imported where needed, so modules only using the string helpers don't load pandas
+    import pandas as pd
 
 
 def configure_logging() -> None:
@@ -64,6 +70,25 @@ def clean_title(s: str) -> str:
     return clean_name(s)
 
 
+def clean_names(s: pd.Series) -> pd.Series:
+    """clean_name for a whole column, called once per distinct value"""
+    # not a regex, as no character class matches isalpha: word characters also take in ½, ² and combining marks
+    unique = s.dropna().unique()
+    return s.map(dict(zip(unique, map(clean_name, unique))))
+
+
+def clean_authors(s: pd.Series) -> pd.Series:
+    """clean_author for a whole column"""
+    names = s.str.strip().str.lower().str.extract(r"^(\S+)(?:.*\s(\S+))?$")
+    return names[0] + "+" + names[1].fillna(names[0])
+
+
+def clean_titles(s: pd.Series) -> pd.Series:
+    """clean_title for a whole column"""
+    s = s.str.replace(r"^([^:]+):.*", r"\1", regex=True).str.replace(r"^([^(]+)\(.*", r"\1", regex=True)
+    return clean_names(s)
+
+
 MD_FILE_TEMPLATE = """---
 author: {author}
 date: {date}
@@ -89,6 +114,8 @@ def as_markdown_file(book: dict) -> None:
 
     Note: Files are stored in the 'outputs' directory
     """
+    import pandas as pd
+
     dt = book["Date Read"]
     if not pd.notna(dt):
         log.warn(f"Bad date, {dt}, for title: {book['Title']}")
@@ -102,3 +129,71 @@ def as_markdown_file(book: dict) -> None:
                 tags=" " if pd.isna(book["Bookshelves"]) else book["Bookshelves"],
             )
         )
+
+
+def _format_columns(template: str, columns: dict[str, pd.Series]) -> pd.Series:
+    # str.format over whole columns, concatenating the template's literal text with the column values
+    out = ""
+    for literal, field, _, _ in string.Formatter().parse(template):
+        out = out + literal
+        if field is not None:
+            out = out + columns[field]
+    return out
+
+
+def as_markdown(books: pd.DataFrame) -> pd.Series:
+    """Markdown, with Obsidian properties, for each book in a Goodreads export
+
+    Args:
+        books (pd.DataFrame): goodreads export rows
+
+    Returns:
+        pd.Series: file contents, indexed by file name. Books without a valid 'Date Read' are skipped.
+    """
+    import pandas as pd
+
+    dates = books["Date Read"].astype("string")
+    valid = dates.str.match(r"\d{4}\D\d{2}\D\d{2}").fillna(False).astype(bool)
+    for title, dt in zip(books["Title"][~valid], books["Date Read"][~valid]):
+        log.warning(f"Bad date, {dt}, for title: {title}")
+    books, dates = books[valid], dates[valid]
+
+    contents = _format_columns(
+        MD_FILE_TEMPLATE,
+        {
+            "author": clean_authors(books["Author"].astype(str)).str.replace("+", " ", regex=False),
+            "date": dates.str.slice(0, 4) + "-" + dates.str.slice(5, 7) + "-" + dates.str.slice(8, 10),
+            "rating": pd.Series("+", index=books.index).str.repeat(books["My Rating"].astype(int).tolist()),
+            "tags": books["Bookshelves"].fillna(" ").astype(str),
+        },
+    )
+    contents.index = books["Title"].astype(str) + ".md"
+    return contents[~contents.index.duplicated(keep="last")].astype(str)
+
+
+def write_markdown_files(books: pd.DataFrame, folder: str = "outputs") -> int:
+    """Generates markdown files for the books of a Goodreads export, only (re)writing files whose content changed
+
+    Args:
+        books (pd.DataFrame): goodreads export rows
+        folder (str, optional): where to write the files. Defaults to "outputs".
+
+    Returns:
+        int: number of files written
+    """
+    # encoded and with line endings as a file opened in text mode writes them, like the files written before
+    written, encoding = 0, locale.getpreferredencoding(False)
+    for name, content in as_markdown(books).items():
+        path, data = os.path.join(folder, name), content.replace("\n", os.linesep).encode(encoding)
+        try:
+            if os.path.getsize(path) == len(data):
+                with open(path, "rb") as fp:
+                    if fp.read() == data:
+                        continue
+        except FileNotFoundError:
+            pass
+        with open(path, "wb") as fp:
+            fp.write(data)
+        written += 1
+    log.info(f"Wrote {written} of {len(books)} book files to {folder}")
+    return written